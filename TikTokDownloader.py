@@ -1,80 +1,69 @@
-from concurrent.futures import ThreadPoolExecutor
-from contextlib import redirect_stdout
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque
+from contextlib import nullcontext, redirect_stdout
+from dataclasses import dataclass, field, fields
+from typing import Iterable, Iterator
 import json
+import queue
+import re
+import sys
 
 import concurrent.futures
-from time import sleep
+from time import perf_counter, sleep
 import requests
+from utils.AdaptiveLimiter import *
 from utils.ArgParser import *
+from utils.Catalog import *
+from utils.DiskWriter import *
+from utils.FileIndex import *
+from utils.JobLedger import *
+from utils.JsonStream import *
+from utils.MediaStore import *
+from utils.Metrics import *
+from utils.PageCache import *
+from utils.PostSchema import *
+from utils.Progress import *
+from utils.ProxyPool import *
+from utils.SessionPool import *
 from utils.parse import *
 from utils.io.ThreadedStdOut import *
 from utils.logging import *
 from utils.FileDownloader import *
 
-def tryProxy(session:requests.Session, proxy:str, timeout:float) -> requests.Session|None:
+gProxyTestUrls = [
+    # "http://google.com",
+    # "https://google.com",
+    "https://tiktok.com"
+]
 
-    proxyTestUrls = [
-        # "http://google.com",
-        # "https://google.com",
-        "https://tiktok.com"
-    ]
+gProxyBannedStrings = [
+    "geoblocking_page",
+    "<title>error</title>"
+]
 
-    proxyBannedStrings = [
-        "geoblocking_page",
-        "<title>error</title>"
-    ]
+gProxyHeaders = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
+}
 
-    session = requests.Session()
-    session.proxies.update({
-        "http":  proxy,
-        "https": proxy,
-    })
+gFreeProxyListUrl = "https://api.proxyscrape.com/v4/free-proxy-list/get?request=display_proxies&protocol=http&proxy_format=protocolipport&format=text&anonymity=Elite&timeout=20000"
 
-    session.headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36'
-    }
-
-    try:
-        for url in proxyTestUrls:
-            log(f"Testing: {proxy} -> {url}")
-            response = session.get(url, timeout=timeout)
-
-            # test page for ban message
-            for bannedString in proxyBannedStrings:
-                if bannedString in response.text.lower():
-                    raise Exception(f"Detected banned string '{bannedString}' in response to: '{url}'")
-
-            log(f"Got proxy! | response: {response.text}")
-
-        return session
-
-    except Exception as e:
-        log(f"{proxy} -> {url} failed with exception: {e}", logLevel=LogLevel.Verbose)
-
-    return None
-
-def getProxySession(session:requests.Session, preferredProxies:list[str], timeout:float) -> requests.Session|None:
-
-    if(preferredProxies): 
-
-        # try to connect to preferred proxies first
-        for proxy in preferredProxies:
-            session = tryProxy(proxy, timeout)
-
-            if session is not None:
-                return session
+def getFreeProxies() -> list[str]:
+    response = requests.get(gFreeProxyListUrl)
+    return [ url.strip() for url in response.text.split("\n") if url.strip() ]
 
+def createProxyPool(preferredProxies:list[str], proxyTimeout:float) -> ProxyPool:
+    """ Starts probing `preferredProxies` in the background. If all of them fail the free proxies from proxyscrape.com are probed instead """
 
-    # try a list of free proxies instead
-    log(f"Exhausted preferred proxy list. Trying to connect to free proxy instead", logLevel=LogLevel.Verbose)
-    response = requests.get("https://api.proxyscrape.com/v4/free-proxy-list/get?request=display_proxies&protocol=http&proxy_format=protocolipport&format=text&anonymity=Elite&timeout=20000")
-    proxyList = [ url.strip() for url in response.text.split("\n") ]
-
-    if(proxyList):
-        return getProxySession(proxyList)
+    proxyPool = ProxyPool(
+        testUrls        = gProxyTestUrls, 
+        bannedStrings   = gProxyBannedStrings, 
+        timeout         = proxyTimeout, 
+        headers         = gProxyHeaders, 
+        fallbackProxies = getFreeProxies
+    )
 
-    # failed to find working proxy
-    return None
+    proxyPool.Probe(preferredProxies)
+    return proxyPool
 
 
 @dataclass
@@ -99,72 +88,314 @@ class DownloadResultType:
         mapping = {field.default: field.name for field in fields(DownloadResultType)}
         return dict(sorted(mapping.items()))
 
+    @staticmethod
+    def IsFinal(type:int) -> bool:
+        """Returns True if a post with result `type` won't change by retrying it in a later run"""
+        return type in (
+            DownloadResultType.DownloadedVideo,
+            DownloadResultType.DownloadedImage,
+            DownloadResultType.DownloadedBoth,
+            DownloadResultType.DownloadedNeither,
+            DownloadResultType.NotAvailable,
+        )
+
+
+gPostIdRegex = re.compile(r"/(?:video|photo|v)/(\d+)")
+
+def getPostId(url:str) -> str:
+    """Returns the numeric post id in `url` or the stripped url if no id is found"""
+
+    match = gPostIdRegex.search(url)
+    if match is not None:
+        return match.group(1)
+
+    return url.strip()
+
 
 gSessionLock = threading.Lock()
 gThreadSessions = {}
 
-def getSession(preferredProxies:list[str]|None, proxyTimeout:float) -> requests.Session|None:
+def getSession(proxyPool:ProxyPool|None, sessionPool:SessionPool) -> tuple[requests.Session, str|None] | None:
+    """ Returns (session, proxy) of the calling thread. Threads are assigned the best available proxy in `proxyPool`
+        or connect directly if `proxyPool` is None and share the session of their proxy from `sessionPool`.
+        Threads whose proxy tripped its circuit breaker are moved to the session of the next best proxy.
+    """
 
+    # check for existing session
+    threadId = threading.get_ident()
     with gSessionLock:
+        threadSession = gThreadSessions.get(threadId)
 
-        # check for existing session
-        threadId = threading.get_ident()
-        if threadId in gThreadSessions:
-            session = gThreadSessions[threadId]
+    if threadSession is not None:
+        session, proxy = threadSession
+        if proxy is None or proxyPool.IsHealthy(proxy):
+            return threadSession
 
-        else:
-        
-            # create new session
-            if preferredProxies is None:
-                session = gThreadSessions[threadId] = requests.Session()
+        log(f"Moving thread off tripped proxy {proxy}", logLevel=LogLevel.Verbose)
+        proxyPool.ReleaseProxy(proxy)
 
-            else:
-                session = getProxySession(preferredProxies, proxyTimeout)
-                if session is not None:
-                    gThreadSessions[threadId] = session
+        with gSessionLock:
+            gThreadSessions.pop(threadId)
+
+    # assign new session
+    # Note: AcquireProxy is called without holding gSessionLock because it blocks until a proxy probe succeeds
+    if proxyPool is None:
+        threadSession = (sessionPool.GetSession(None, requests.Session), None)
+
+    else:
+        proxy = proxyPool.AcquireProxy()
+        if proxy is None:
+            return None
+
+        threadSession = (sessionPool.GetSession(proxy, lambda: proxyPool.CreateSession(proxy)), proxy)
+
+    with gSessionLock:
+        gThreadSessions[threadId] = threadSession
+
+    return threadSession
+
+def getSessionProxy() -> str|None:
+    """Returns the proxy of the calling thread's session or None if the thread has no session or connects directly"""
+
+    with gSessionLock:
+        threadSession = gThreadSessions.get(threading.get_ident())
+
+    return None if threadSession is None else threadSession[1]
+
+
+@dataclass
+class PostResult:
+    url        : str
+    resultType : int
+    downloadDir: str
+
+    # Note: proxy is the proxy that served the post or None if it was downloaded directly 
+    proxy      : str|None = None
+
+    # Note: savePaths lists the files saved for a successfully downloaded post and is used
+    #       to link the post into the other download dirs it appears in
+    savePaths  : list[str] = field(default_factory=list)
+
+
+class PostJob:
+    """Tracks the media files of a parsed post while they are downloaded by the media stage"""
+
+    # Note: signed media urls that expired or were revoked are rejected with one of these status codes
+    kExpiredMediaStatusCodes = (403, 404, 410)
+
+    def __init__(self, url:str, resultType:DownloadResultType, downloadDir:str, saveDir:str, downloadFiles:list[tuple[str, str]], storeKeys:dict[str, str], session:requests.Session, proxy:str|None) -> None:
+        self.url = url
+        self.resultType = resultType
+        self.downloadDir = downloadDir
+        self.saveDir = saveDir
+        self.downloadFiles = downloadFiles
+        self.session = session
+        self.proxy = proxy
+
+        # Note: storeKeys maps the savePath of media shared between posts to its MediaStore key
+        self.storeKeys = storeKeys
+
+        # Note: future, ledger, fileIndex, proxyPool and pageCache are assigned by the scheduler before the post is started
+        self.future:Future|None = None
+        self.ledger:JobLedger|None = None
+        self.fileIndex:FileIndex|None = None
+        self.proxyPool:ProxyPool|None = None
+        self.pageCache:PageCache|None = None
+
+        self.lock = threading.Lock()
+        self.numOutstandingFiles = 0
+        self.pendingFiles:deque[tuple[str, str]] = deque()
+        self.downloadExceptions:list[Exception] = []
+
+    def Start(self, mediaQueue:queue.Queue, maxConcurrentFiles:int) -> None:
+        """ Pushes up to `maxConcurrentFiles` outstanding files of the post onto `mediaQueue`. Blocks while the queue is full.
+            The remaining files are handed out by FinishFile as the first files complete.
+        """
+
+        outstandingFiles = []
+        for downloadUrl, savePath in self.downloadFiles:
+
+            # Note: the file index is checked first because it doesn't need a database query. It only knows files it recorded
+            #       complete itself, so files the ledger verified are recorded in it for the next run
+            if self.fileIndex is not None and self.fileIndex.IsFileComplete(savePath):
+                log(f"Skipping '{savePath}' completed in previous run", logLevel=LogLevel.Verbose)
+                continue
 
-    return session
+            if self.ledger is not None and self.ledger.IsFileComplete(savePath):
+                log(f"Skipping '{savePath}' completed in previous run", logLevel=LogLevel.Verbose)
 
+                if self.fileIndex is not None:
+                    self.fileIndex.AddFile(savePath)
 
+                continue
 
-def downloadUrlThread_(url:str, preferredProxies:list[str]|None|None, proxyTimeout:float, downloadDir:str, maxRetries:int=5, retryTimeout:float=5) -> tuple[str, DownloadResultType]:
+            outstandingFiles.append( (downloadUrl, savePath) )
+
+        if not outstandingFiles:
+            self._Resolve()
+            return
+
+        # Note: numOutstandingFiles and pendingFiles must be set before the first put because media threads may finish files immediately
+        maxConcurrentFiles = max(1, maxConcurrentFiles)
+        self.numOutstandingFiles = len(outstandingFiles)
+        self.pendingFiles.extend(outstandingFiles[maxConcurrentFiles:])
+
+        for downloadUrl, savePath in outstandingFiles[:maxConcurrentFiles]:
+            mediaQueue.put( (self, downloadUrl, savePath) )
+
+    def FinishFile(self, downloadUrl:str, savePath:str, exception:Exception|None) -> tuple[str, str] | None:
+        """ Records the completion of a file and returns the next pending (url, savePath) of the post for the calling
+            media thread to download or None if there are no pending files left.
+        """
+
+        # Note: only connection failures count against the proxy. HTTP errors (Ex: expired media urls) are not the proxy's fault
+        if self.proxyPool is not None and self.proxy is not None:
+            try:
+                if exception is None:
+                    self.proxyPool.ReportSuccess(self.proxy)
+
+                elif isinstance(exception, (requests.ConnectionError, requests.Timeout)):
+                    self.proxyPool.ReportFailure(self.proxy)
+
+            except Exception as e:
+                error(f"Failed to report proxy: {self.proxy} for url: {self.url} | Exception: {e}")
+
+        if exception is None:
+            try:
+                if self.ledger is not None:
+                    self.ledger.SetFileComplete(postId=getPostId(self.url), url=downloadUrl, savePath=savePath)
+
+                if self.fileIndex is not None:
+                    self.fileIndex.AddFile(savePath)
+
+            except Exception as e:
+                exception = e
+
+        with self.lock:
+            if exception is not None:
+                self.downloadExceptions.append(exception)
+
+            self.numOutstandingFiles-= 1
+            if self.pendingFiles:
+                return self.pendingFiles.popleft()
+
+            if self.numOutstandingFiles > 0:
+                return None
+
+        self._Resolve()
+        return None
+
+    @staticmethod
+    def IsExpiredMediaError(exception:Exception) -> bool:
+        """Returns True if `exception` is an HTTP error returned for an expired or revoked media url"""
+
+        response = exception.response if isinstance(exception, requests.HTTPError) else None
+        return response is not None and response.status_code in PostJob.kExpiredMediaStatusCodes
+
+    def _Resolve(self) -> None:
+        """Resolves future with the PostResult of the post"""
+
+        numDownloadExceptions = len(self.downloadExceptions)
+        if numDownloadExceptions > 0:
+            error(f"Error While Downloading {numDownloadExceptions}/{len(self.downloadFiles)} for url: {self.url} | Exceptions: {self.downloadExceptions}", url=self.url, proxy=self.proxy)
+
+            # Note: the cached page is only dropped if its media urls were rejected. Connection and proxy errors keep it
+            #       so the retry can skip the page fetch
+            if self.pageCache is not None and any(PostJob.IsExpiredMediaError(e) for e in self.downloadExceptions):
+                try:
+                    self.pageCache.Remove(getPostId(self.url))
+                except Exception as e:
+                    error(f"Failed to remove cached page for url: {self.url} | Exception: {e}")
+
+            self.future.set_result(PostResult(self.url, DownloadResultType.DownloadError, self.downloadDir, self.proxy))
+            return
+
+        savePaths = [f"{self.saveDir}/metadata.txt"] + [savePath for _, savePath in self.downloadFiles]
+        self.future.set_result(PostResult(self.url, self.resultType, self.downloadDir, self.proxy, savePaths))
+
+
+def parseUrlThread_(url:str, proxyPool:ProxyPool|None, sessionPool:SessionPool, downloadDir:str, pageLimiter:AdaptiveLimiter, pageCache:PageCache|None, catalog:Catalog|None, metrics:Metrics, maxRetries:int=5, retryTimeout:float=5) -> tuple[str, DownloadResultType] | PostJob:
     print(f"Parsing: {url} for download link...")
 
     
-    # Note: we initialize response to None because the very first session.get could throw an exception
-    #       and thus response will not be defined
+    # Note: we initialize response to None because the page fetch could throw an exception or
+    #       be skipped for cached pages and thus response will not be defined
     response = None
 
     # Note: downloadFile is in format (url, savePath)
     downloadFiles:list[tuple[str, str]] = []
+    storeKeys:dict[str, str] = {}
     try:
 
-        session = getSession(preferredProxies, proxyTimeout)
-        if session is None:
-            error(f"Failed to get proxy session | preferredProxies: {preferredProxies} | proxyTimeout: {proxyTimeout}")
-            return url, DownloadResultType.ProxyError
+        # Note: cached scripts skip the page fetch, which is the request most likely to be blocked by a captcha,
+        #       but still need a session to download the media
+        postId = getPostId(url)
+        scriptText = None if pageCache is None else pageCache.Get(postId)
+        isCachedScript = scriptText is not None
 
         # parse __UNIVERSAL_DATA_FOR_REHYDRATION__ script
         numRetries = 0
         while True:
+
+            # Note: the session is fetched on every attempt so retries fail over to a new proxy once the circuit breaker of the current one trips
+            sessionStartTime = perf_counter()
+            threadSession = getSession(proxyPool, sessionPool)
+            metrics.Record("session", perf_counter() - sessionStartTime)
+
+            if threadSession is None:
+                error(f"Failed to get proxy session | all proxy probes failed")
+                return url, DownloadResultType.ProxyError
+
+            session, proxy = threadSession
+            if isCachedScript:
+                log(f"Using cached page for url: {url}", logLevel=LogLevel.Verbose)
+                break
+
+            response = None
+
+            # Note: isBlocked stays None if session.get raises so connection errors don't change the page limit 
+            isBlocked = None
+            limiterEpoch = pageLimiter.Acquire()
             try:
+                fetchStartTime = perf_counter()
                 response = session.get(url)
-                scriptSoup = parseHtmlElement(response.content, "script", {"id": "__UNIVERSAL_DATA_FOR_REHYDRATION__"})
+                metrics.Record("pageFetch", perf_counter() - fetchStartTime, len(response.content))
+
+                isBlocked = True
+                extractStartTime = perf_counter()
+                scriptText = parseHtmlScriptText(response.content, "__UNIVERSAL_DATA_FOR_REHYDRATION__")
+                metrics.Record("scriptExtract", perf_counter() - extractStartTime, len(response.content))
+
+                isBlocked = False
                 break
 
-            except ParseException as e:
+            except (ParseException, requests.RequestException) as e:
+                responseContent = None if response is None else response.content
                 if numRetries >= maxRetries:
-                    error(f"Failed to parse script after {numRetries} retries! | exception: {e} | response: {response.content}")
+                    error(f"Failed to parse script after {numRetries} retries! | proxy: {proxy} | exception: {e} | response: {responseContent}", url=url, proxy=proxy)
                     return url, DownloadResultType.ParseError
 
-            warn(f"[{numRetries+1}/{maxRetries}] Failed to parse script (blocked by captcha?). Sleeping for {retryTimeout} seconds and reattempting | url: {url} | response: {response.content}")
+                warn(f"[{numRetries+1}/{maxRetries}] Failed to parse script (blocked by captcha?). Sleeping for {retryTimeout} seconds and reattempting | url: {url} | proxy: {proxy} | exception: {e} | response: {responseContent}")
+
+            finally:
+                pageLimiter.Release(limiterEpoch, isBlocked)
+
+                if proxy is not None:
+                    if isBlocked is False:
+                        proxyPool.ReportSuccess(proxy)
+                    else:
+                        proxyPool.ReportFailure(proxy)
+
             sleep(retryTimeout)
             numRetries+= 1
 
 
         # parse script json
-        scriptJson  = json.loads(scriptSoup.text.encode('ascii','xmlcharrefreplace'))
-        detail = ParsableDictionary(scriptJson["__DEFAULT_SCOPE__"]["webapp.video-detail"])
+        parseStartTime = perf_counter()
+        scriptJson  = json.loads(scriptText.encode('ascii','xmlcharrefreplace'))
+
+        # Note: scriptJson is owned by this thread and only read, so we parse it through a view instead of copying every subtree
+        detail = ParsableDictionaryView(scriptJson["__DEFAULT_SCOPE__"]["webapp.video-detail"])
         
         detailStatusCode = detail.parse("statusCode", int)
 
@@ -182,6 +413,9 @@ def downloadUrlThread_(url:str, preferredProxies:list[str]|None|None, proxyTimeo
             error(f"Detected unknown status for url: {url} |  detail: {detail}")
             return url, DownloadResultType.ParseError
 
+        if pageCache is not None and not isCachedScript:
+            pageCache.Put(postId, scriptText)
+
 
         itemInfo   = detail.parse("itemInfo", ParsableDictionary)
         itemStruct = itemInfo.parse("itemStruct",  ParsableDictionary)
@@ -192,68 +426,79 @@ def downloadUrlThread_(url:str, preferredProxies:list[str]|None|None, proxyTimeo
             log(f"Detected classified content for url: {url} | detail: {detail}", logLevel=LogLevel.Verbose)
             return url, DownloadResultType.Restricted
 
-        videoInfo  = itemStruct.parse("video",  ParsableDictionary)
-        musicInfo  = itemStruct.parse("music",  ParsableDictionary)
-        authorInfo = itemStruct.parse("author", ParsableDictionary)
+        # Note: every field of the post is read by the compiled kPostSchema in a single pass
+        post = extractPost(itemStruct)
 
-        id            = parseStripedHtmlString(itemStruct.parse("id", str))
-        timestamp     = itemStruct.parse("createTime", int)
-        comments      = itemStruct.parse("comments", list[str])
-        keywords      = itemStruct.parseDefault("suggestedWords", [])
-        location      = parseStripedHtmlString(itemStruct.parse("locationCreated"))
-        description   = parseStripedHtmlString(itemStruct.parse("desc"))
+        id            = post.id
+        timestamp     = post.timestamp
+        comments      = post.comments
+        keywords      = post.keywords
+        location      = post.location
+        description   = post.description
         
-        userId        = parseStripedHtmlString(authorInfo.parse("uniqueId")) 
-        userNickname  = parseStripedHtmlString(authorInfo.parse("nickname")) 
-        userSignature = parseStripedHtmlString(authorInfo.parse("signature")) 
+        userId        = post.userId
+        userNickname  = post.userNickname
+        userSignature = post.userSignature
         
-        musicUrl      = parseStripedHtmlString(musicInfo.parse("playUrl"))
-        musicCoverUrl = parseStripedHtmlString(musicInfo.parse("coverLarge"))
-        musicName     = parseStripedHtmlString(musicInfo.parse("title"))
-        musicArtist   = parseStripedHtmlString(musicInfo.parseDefault("authorName", "N/A"))
-        musicAlbum    = parseStripedHtmlString(musicInfo.parseDefault("album", "N/A"))
+        musicUrl      = post.musicUrl
+        musicCoverUrl = post.musicCoverUrl
+        musicName     = post.musicName
+        musicArtist   = post.musicArtist
+        musicAlbum    = post.musicAlbum
+        musicId       = post.musicId
 
 
         # Note: userIds may contain only unclean symbols so we store all unrepresentable
         #       userIds in a common '_' folder
-        sanitizedUserId = FileDownloader.SanitizeName(userId) or "_" 
+        sanitizedUserId = FileDownloader.FitName(FileDownloader.SanitizeName(userId)) or "_" 
+
+        # Note: descriptions are truncated to fit the id suffix in a single name. The id keeps truncated names unique
         sanitizedDescription = FileDownloader.SanitizeName(description)
-        sanitizedDescriptionId = f"{sanitizedDescription[:255-(len(id) + 3)]} - {id}" if sanitizedDescription else f"{id}"
+        sanitizedDescriptionIdSuffix = f" - {id}"
+        sanitizedDescriptionId = (
+            FileDownloader.TruncateName(sanitizedDescription, FileDownloader.kMaxNameBytes - FileDownloader.GetNameBytes(sanitizedDescriptionIdSuffix)) + sanitizedDescriptionIdSuffix 
+            if sanitizedDescription else f"{id}"
+        )
         sanitizedSaveDir = f"{downloadDir}/{sanitizedUserId}/{sanitizedDescriptionId}"
 
         # add music to downloadFiles
         sanitizedMusicName = FileDownloader.SanitizeName(musicName) 
         sanitizedMusicSuffix = f" - {sanitizedMusicName}" if sanitizedMusicName else ""
 
+        # Note: music is shared between many posts so we key it by musicId, or the unsigned url if there is no id, 
+        #       to fetch it from the MediaStore instead of downloading it for every post
+
         if musicUrl:
-            downloadFiles.append( (musicUrl, f"{sanitizedSaveDir}/music{sanitizedMusicSuffix}.mp3") )
+            musicSavePath = f"{sanitizedSaveDir}/{FileDownloader.FitName(f'music{sanitizedMusicSuffix}', '.mp3', FileDownloader.kMaxFileNameBytes)}"
+            downloadFiles.append( (musicUrl, musicSavePath) )
+            storeKeys[musicSavePath] = f"music-{musicId or urllib.parse.urlsplit(musicUrl).path}"
     
         if musicCoverUrl:
-            downloadFiles.append( (musicCoverUrl, f"{sanitizedSaveDir}/music cover{sanitizedMusicSuffix}.jpeg") )
+            musicCoverSavePath = f"{sanitizedSaveDir}/{FileDownloader.FitName(f'music cover{sanitizedMusicSuffix}', '.jpeg', FileDownloader.kMaxFileNameBytes)}"
+            downloadFiles.append( (musicCoverUrl, musicCoverSavePath) )
+            storeKeys[musicCoverSavePath] = f"musicCover-{musicId or urllib.parse.urlsplit(musicCoverUrl).path}"
 
 
         resultType = DownloadResultType.DownloadedNeither
         
-        videoPlayUrl = parseStripedHtmlString(videoInfo.parse("playAddr"))
+        videoPlayUrl = post.videoPlayUrl
         if videoPlayUrl:
 
             # Add video to downloadFiles 
-            videoExtension = parseStripedHtmlString(videoInfo.parse("format"))
+            videoExtension = post.videoExtension
+            if videoExtension is None:
+                raise ParseException("Missing required key itemStruct.video.format")
+
             downloadFiles.append( (videoPlayUrl, f"{sanitizedSaveDir}/video.{videoExtension}") )
 
             resultType = DownloadResultType.DownloadedVideo
 
-        imagePost = itemStruct.parseDefault("imagePost", None, ParsableDictionary)
-        if imagePost is not None:
+        if post.imageUrlLists is not None:
+            imagePost = itemStruct["imagePost"]
             log(f"Detected photo for url: {url} | imagePost: {imagePost}", logLevel=LogLevel.Verbose)
-
-            images = imagePost.parse("images", list[ParsableDictionary])
  
             # add image files to downloadFiles
-            for i, image in enumerate(images):
- 
-                imageUrlDict = image.parse("imageURL", ParsableDictionary)
-                imageUrls = imageUrlDict.parse("urlList", list[str])
+            for i, imageUrls in enumerate(post.imageUrlLists):
 
                 numImageUrls = len(imageUrls)
                 if numImageUrls == 0:
@@ -273,65 +518,138 @@ def downloadUrlThread_(url:str, preferredProxies:list[str]|None|None, proxyTimeo
         if resultType == DownloadResultType.DownloadedNeither:
             warn(f"Missing video and image post for url: {url} | itemStruct: {itemStruct}")
 
+        metrics.Record("postParse", perf_counter() - parseStartTime, len(scriptText))
 
     except Exception as e:
         error(f"Error While Parsing: {url} | Exception: {e} | response: {'None' if response is None else response.content}")
         return url, DownloadResultType.ParseError
 
     # Make metadata file
-    # Note: exist_ok to prevent a race condition with another thread
-    os.makedirs(sanitizedSaveDir, exist_ok=True)
+    try:
+        # Note: exist_ok to prevent a race condition with another thread
+        os.makedirs(sanitizedSaveDir, exist_ok=True)
     
-    print(f"Writing Metadata file for {url}")
-    metaData = ""
-    with open(f"{sanitizedSaveDir}/metadata.txt", "w", encoding="utf-8") as file:
-        metaData+= f"Url:        {url}\n" 
-        metaData+= f"Date:       {datetime.fromtimestamp(timestamp)}\n"
-        metaData+= f"Location:   {location}\n"
-        metaData+= f"Content ID: {id}\n"
-        metaData+= f"\n"
-        metaData+= f"UserId:    {userId}\n"
-        metaData+= f"Nickname:  {userNickname}\n"
-        metaData+= f"Signature: {{\n"
-        metaData+= f"\t{userSignature.replace('\n', '\n\t')}\n"
-        metaData+= f"}}\n"
-        metaData+= f"\n"
-        metaData+= f"Music:     {musicName}\n"
-        metaData+= f"Artist:    {musicArtist}\n"
-        metaData+= f"Album:     {musicAlbum}\n"
-        metaData+= f"Music Url: {musicUrl}\n"
-        metaData+= f"Cover Url: {musicCoverUrl}\n"
-        metaData+= f"\n"
-        metaData+= f"Keywords [{len(keywords)}] {{\n"
-        metaData+= f"\t{'\n\t'.join(keywords)}\n"
-        metaData+= f"}}\n"
-        metaData+= f"\n"
-        metaData+= f"Description {{\n"
-        metaData+= f"\t{description.replace('\n', '\n\t')}\n"
-        metaData+= f"}}\n"
-        metaData+= f"\n"
-        metaData+= f"Comments [{len(comments)}] {{\n"
-        metaData+= f"\t{'\n\t'.join(comments)}\n"
-        metaData+= f"}}\n"
-
-        file.write(metaData)
+        print(f"Writing Metadata file for {url}")
+        metadataStartTime = perf_counter()
+        metaData = ""
+        with open(f"{sanitizedSaveDir}/metadata.txt", "w", encoding="utf-8") as file:
+            metaData+= f"Url:        {url}\n" 
+            metaData+= f"Date:       {datetime.fromtimestamp(timestamp)}\n"
+            metaData+= f"Location:   {location}\n"
+            metaData+= f"Content ID: {id}\n"
+            metaData+= f"\n"
+            metaData+= f"UserId:    {userId}\n"
+            metaData+= f"Nickname:  {userNickname}\n"
+            metaData+= f"Signature: {{\n"
+            metaData+= f"\t{userSignature.replace('\n', '\n\t')}\n"
+            metaData+= f"}}\n"
+            metaData+= f"\n"
+            metaData+= f"Music:     {musicName}\n"
+            metaData+= f"Artist:    {musicArtist}\n"
+            metaData+= f"Album:     {musicAlbum}\n"
+            metaData+= f"Music Url: {musicUrl}\n"
+            metaData+= f"Cover Url: {musicCoverUrl}\n"
+            metaData+= f"\n"
+            metaData+= f"Keywords [{len(keywords)}] {{\n"
+            metaData+= f"\t{'\n\t'.join(keywords)}\n"
+            metaData+= f"}}\n"
+            metaData+= f"\n"
+            metaData+= f"Description {{\n"
+            metaData+= f"\t{description.replace('\n', '\n\t')}\n"
+            metaData+= f"}}\n"
+            metaData+= f"\n"
+            metaData+= f"Comments [{len(comments)}] {{\n"
+            metaData+= f"\t{'\n\t'.join(comments)}\n"
+            metaData+= f"}}\n"
+
+            file.write(metaData)
+
+        metrics.Record("metadataWrite", perf_counter() - metadataStartTime, len(metaData))
 
-    # download files
-    downloadExceptions = []
-    for downloadUrl, savePath in downloadFiles:
-        downloadException = FileDownloader._DownloadThread(session=session, savePath=savePath, url=downloadUrl)
-        if downloadException is not None:
-            downloadExceptions.append(downloadException)
-
-    numDownloadExceptions = len(downloadExceptions)
-    if numDownloadExceptions > 0:
-        error(f"Error While Downloading {numDownloadExceptions}/{len(downloadFiles)} for url: {url} | Exceptions: {downloadExceptions} | itemStruct: {itemStruct}")
+    except Exception as e:
+        error(f"Failed to write metadata file for url: {url} | saveDir: '{sanitizedSaveDir}' | Exception: {e}", url=url)
         return url, DownloadResultType.DownloadError
 
-    return url, resultType
+    # Note: the catalog only mirrors metadata.txt so a post that can't be cataloged is still downloaded
+    if catalog is not None:
+        try:
+            catalog.AddPost(postId, url, sanitizedSaveDir, post)
+        except Exception as e:
+            error(f"Failed to add post to catalog for url: {url} | Exception: {e}", url=url)
+
+    return PostJob(url, resultType, downloadDir, sanitizedSaveDir, downloadFiles, storeKeys, session, proxy)
+
+
+def schedulePostThread_(postFuture:Future, mediaQueue:queue.Queue, maxPostDownloads:int, ledger:JobLedger|None, fileIndex:FileIndex|None, **parseKwargs) -> None:
+    """Parse stage worker. Parses a post page and hands its media files to the media stage through `mediaQueue`"""
+
+    try:
+        postJob = parseUrlThread_(**parseKwargs)
+
+        if not isinstance(postJob, PostJob):
+            url, resultType = postJob
+            postFuture.set_result(PostResult(url, resultType, parseKwargs["downloadDir"], getSessionProxy()))
+            return
+
+        postJob.future = postFuture
+        postJob.ledger = ledger
+        postJob.fileIndex = fileIndex
+        postJob.proxyPool = parseKwargs["proxyPool"]
+        postJob.pageCache = parseKwargs["pageCache"]
+        postJob.Start(mediaQueue, maxConcurrentFiles=maxPostDownloads)
+
+    except Exception as e:
+        if not postFuture.done():
+            postFuture.set_exception(e)
+
+def downloadMediaThread_(mediaQueue:queue.Queue, mediaStore:MediaStore|None, diskWriter:DiskWriter|None, progress:Progress, metrics:Metrics) -> None:
+    """ Media stage worker. Downloads (postJob, url, savePath) jobs from `mediaQueue` until it receives None.
+        Pending files of a post are downloaded directly by the thread that finished one of its files so a post
+        never has more than its maxPostDownloads files in flight.
+    """
+
+    while True:
+        mediaJob = mediaQueue.get()
+        if mediaJob is None:
+            return
+
+        postJob, downloadUrl, savePath = mediaJob
+        while True:
+            downloadStartTime = perf_counter()
+
+            # Note: every exception is handed to FinishFile so the post always resolves. An exception escaping
+            #       this thread would leave the post's future unresolved and hang downloadPosts
+            try:
+                storeKey = postJob.storeKeys.get(savePath)
+                if mediaStore is not None and storeKey is not None:
+                    stage = "mediaStore"
+                    downloadException = mediaStore.Fetch(session=postJob.session, key=storeKey, url=downloadUrl, savePath=savePath, progress=progress, diskWriter=diskWriter, metrics=metrics)
+                else:
+                    stage = "mediaDownload"
+                    downloadException = FileDownloader._DownloadThread(session=postJob.session, savePath=savePath, url=downloadUrl, progress=progress, diskWriter=diskWriter, metrics=metrics)
+
+                # Note: only successful downloads are recorded so failures don't skew the transfer rate
+                if downloadException is None:
+                    metrics.Record(stage, perf_counter() - downloadStartTime, os.path.getsize(savePath))
+
+            except Exception as e:
+                downloadException = e
+
+            try:
+                nextFile = postJob.FinishFile(downloadUrl, savePath, downloadException)
+
+            except Exception as e:
+                error(f"Failed to finish '{savePath}' for url: {postJob.url} | Exception: {e}")
+                break
+
+            if nextFile is None:
+                break
+
+            downloadUrl, savePath = nextFile
 
 class UrlDownloadResults:
     resultList:list[list[str]]
+    urlProxies:dict[str, str]
 
     def __init__(self):
 
@@ -339,9 +657,14 @@ class UrlDownloadResults:
         for _ in range(DownloadResultType.NumTypes()):
             self.resultList.append(list())
 
-    def AddResult(self, url:str, type:DownloadResultType) -> None:
+        self.urlProxies = dict()
+
+    def AddResult(self, url:str, type:DownloadResultType, proxy:str|None = None) -> None:
         self.resultList[int(type)].append(url) 
 
+        if proxy is not None:
+            self.urlProxies[url] = proxy
+
     def GetUrls(self, type:DownloadResultType) -> list[str]:
         return self.resultList[int(type)]
     
@@ -367,43 +690,237 @@ class UrlDownloadResults:
             file.write(f"Result Summary - {self}\n\n")
 
             for field in fields(DownloadResultType):                
-                fieldUrls = self.resultList[field.default]                
+                fieldUrls = [(f"{url} | proxy: {self.urlProxies[url]}" if url in self.urlProxies else url) for url in self.resultList[field.default]]
                 file.write(f"{field.name} Urls [{len(fieldUrls)}]:\n\t{'\n\t'.join(fieldUrls)}\n\n")
 
 
-def downloadUrls(urls:list[str], downloadDir:str, preferredProxies:list[str]|None, proxyTimeout:float, numThreads:int) -> UrlDownloadResults:    
-    futures = []
-    threadPool = ThreadPoolExecutor(max_workers=numThreads)
-    
-    numUrls = len(urls)
-    results = UrlDownloadResults()
+def linkPost(postResult:PostResult, linkDownloadDir:str) -> bool:
+    """ Links the files of a downloaded post into the same relative location of `linkDownloadDir`. 
+        Returns False if linking failed.
+    """
+
+    for savePath in postResult.savePaths:
+        linkPath = os.path.join(linkDownloadDir, os.path.relpath(savePath, postResult.downloadDir))
+
+        try:
+            FileDownloader.LinkFile(savePath, linkPath)
+
+        except Exception as e:
+            error(f"Failed to link '{linkPath}' to '{savePath}' for url: {postResult.url} | Exception: {e}")
+            return False
+
+    return True
+
+def downloadPosts(urlEntries:Iterable[tuple[str, str]], downloadDirs:list[str], proxyPool:ProxyPool|None, numThreads:int, numDownloadThreads:int, downloadQueueSize:int, maxPostDownloads:int, ledger:JobLedger|None=None, fileIndex:FileIndex|None=None, mediaStore:MediaStore|None=None, diskWriter:DiskWriter|None=None, sessionPool:SessionPool|None=None, pageCache:PageCache|None=None, catalog:Catalog|None=None, metrics:Metrics|None=None, retryTimeout:float=5) -> dict[str, UrlDownloadResults]:
+    """ Downloads the posts in `urlEntries`, an iterable of (downloadDir, url), and returns the results of each download dir.
+        Entries are scheduled as they are consumed so `urlEntries` can be a generator that streams urls in.
+        Posts that appear in several download dirs are downloaded once and linked into the other dirs.
+    """
+
+    results = {downloadDir: UrlDownloadResults() for downloadDir in downloadDirs}
+    ledgerResults = {downloadDir: ({} if ledger is None else ledger.GetResults(downloadDir)) for downloadDir in downloadDirs}
+
+    # Note: postTargets is in format postId -> [(url, downloadDir), ...] and contains an entry for every scheduled post.
+    #       Targets that arrive after their post finished are linked as soon as they are consumed
+    postTargets:dict[str, list[tuple[str, str]]] = {}
+    postResults:dict[str, PostResult] = {}
+    futurePostIds:dict[Future, str] = {}
+    futureStartTimes:dict[Future, float] = {}
+    completedFutures = queue.Queue()
+
+    numUrls = 0
+    numSkippedUrls = 0
+
+    def addTargetResult(postId:str, url:str, downloadDir:str, postResult:PostResult) -> None:
+        resultType = postResult.resultType
+        savePaths = postResult.savePaths
+
+        if downloadDir != postResult.downloadDir and savePaths:
+            if linkPost(postResult, downloadDir):
+                savePaths = [os.path.join(downloadDir, os.path.relpath(savePath, postResult.downloadDir)) for savePath in savePaths]
+            else:
+                resultType = DownloadResultType.DownloadError
+                savePaths = []
+
+        results[downloadDir].AddResult(url, resultType, postResult.proxy)
+        if ledger is not None:
+            ledger.SetResult(postId, downloadDir, url, resultType)
+
+        if catalog is not None:
+            catalog.AddResult(postId, downloadDir, url, resultType, DownloadResultType.getMapping()[resultType], savePaths)
+
+    def completePost(future:Future) -> None:
+        postId = futurePostIds.pop(future)
+        metrics.Record("post", perf_counter() - futureStartTimes.pop(future))
+
+        postResult = postResults[postId] = future.result()
+        resultName = DownloadResultType.getMapping()[postResult.resultType]
+        log(f"Finished post {postId} | result: {resultName} | proxy: {postResult.proxy}", logLevel=LogLevel.Verbose, url=postResult.url, result=resultName, proxy=postResult.proxy)
+
+        for url, downloadDir in postTargets[postId]:
+            addTargetResult(postId, url, downloadDir, postResult)
+
+        # Note: posts with a final result are skipped by the ledger in later runs so their cached page won't be used again
+        if pageCache is not None and DownloadResultType.IsFinal(postResult.resultType):
+            pageCache.Remove(postId)
+
+        progress.AddResult(resultName)
+
+    # Note: parse threads block on mediaQueue.put while the queue is full which throttles 
+    #       page fetches to the rate the media threads can download files 
+    mediaQueue = queue.Queue(maxsize=downloadQueueSize)
+
+    # Note: by default every thread can keep a connection alive to each host
+    if sessionPool is None:
+        sessionPool = SessionPool(numHosts=SessionPool.kDefaultNumHosts, hostConnections=numThreads + numDownloadThreads)
+
+    if metrics is None:
+        metrics = Metrics()
+
+    # Note: pageLimiter shrinks the number of in-flight page requests when tiktok starts blocking them with captchas
+    pageLimiter = AdaptiveLimiter(maxLimit=numThreads)
+    parseThreadPool = ThreadPoolExecutor(max_workers=numThreads)
+    mediaThreadPool = ThreadPoolExecutor(max_workers=numDownloadThreads)
 
-    stdOutHeader = f"--- Downloading {len(urls)} files to '{downloadDir}' (this may take some time) ---"
-    with redirect_stdout(ThreadedStdOut(header=stdOutHeader)):
+    # Note: when stdout isn't a terminal (Ex: redirected to a file) thread status lines are printed as is and progress is logged periodically
+    isTerminal = sys.stdout.isatty()
 
-        for url in urls:
-            downloadFuture = threadPool.submit(downloadUrlThread_, url=url, preferredProxies=preferredProxies, proxyTimeout=proxyTimeout, downloadDir=downloadDir)
-            futures.append(downloadFuture)
+    stdOutHeader = f"--- Downloading posts to {downloadDirs} (this may take some time) ---"
+    with (ThreadedStdOut(header=stdOutHeader) if isTerminal else nullcontext(sys.stdout)) as threadedStdOut, redirect_stdout(threadedStdOut), Progress(isTerminal, getStatus=pageLimiter.__str__) as progress:
 
-        for i, future in enumerate(concurrent.futures.as_completed(futures)):
+        for _ in range(numDownloadThreads):
+            mediaThreadPool.submit(downloadMediaThread_, mediaQueue=mediaQueue, mediaStore=mediaStore, diskWriter=diskWriter, progress=progress, metrics=metrics)
 
-            print(f"Waiting for threads to finish - Progress: {i}/{numUrls} [{(100*i/numUrls):.2f}%] - Results: {results}")
-            
-            url, resultType = future.result() 
-            results.AddResult(url, resultType)
+        for downloadDir, url in urlEntries:
+            numUrls+= 1
+            postId = getPostId(url)
+
+            # skip posts that already reached a final result in a previous run
+            resultType = ledgerResults[downloadDir].get(postId)
+            if resultType is not None and DownloadResultType.IsFinal(resultType):
+                results[downloadDir].AddResult(url, resultType)
+                numSkippedUrls+= 1
+                continue
+
+            targets = postTargets.get(postId)
+            if targets is not None:
+                targets.append( (url, downloadDir) )
+
+                # link posts that already finished now. Otherwise completePost handles the new target
+                postResult = postResults.get(postId)
+                if postResult is not None:
+                    addTargetResult(postId, url, downloadDir, postResult)
+
+                continue
+
+            postTargets[postId] = [ (url, downloadDir) ]
+            progress.AddPosts()
+
+            postFuture = Future()
+            futurePostIds[postFuture] = postId
+            futureStartTimes[postFuture] = perf_counter()
+            postFuture.add_done_callback(completedFutures.put)
+            parseThreadPool.submit(schedulePostThread_, postFuture=postFuture, mediaQueue=mediaQueue, maxPostDownloads=maxPostDownloads, ledger=ledger, fileIndex=fileIndex, url=url, proxyPool=proxyPool, sessionPool=sessionPool, downloadDir=downloadDir, pageLimiter=pageLimiter, pageCache=pageCache, catalog=catalog, metrics=metrics, retryTimeout=retryTimeout)
+
+            # process completed posts while we are still consuming urlEntries
+            while not completedFutures.empty():
+                completePost(completedFutures.get())
+
+        if numSkippedUrls > 0:
+            log(f"Skipped {numSkippedUrls}/{numUrls} urls completed in previous run | ledger: '{ledger.filePath}'")
+
+        log(f"Scheduled {len(postTargets)} unique posts for {numUrls - numSkippedUrls} urls", logLevel=LogLevel.Verbose)
+
+        while futurePostIds:
+            completePost(completedFutures.get())
+
+        # stop media threads
+        for _ in range(numDownloadThreads):
+            mediaQueue.put(None)
+
+        parseThreadPool.shutdown()
+        mediaThreadPool.shutdown()
+
+        # Note: log lines are printed by the log writer thread so queued lines are printed before stdout is restored
+        flushLog()
+
+    log(f"{sessionPool}", logLevel=LogLevel.Verbose)
+
+    if mediaStore is not None:
+        log(f"Media store fetches - hits: {mediaStore.numHits} | misses: {mediaStore.numMisses} | storeDir: '{mediaStore.storeDir}'", logLevel=LogLevel.Verbose)
+
+    # Note: media threads are either waiting on the network for chunks or on the disk to write them (or buffer them with --writeBehind)
+    stages = metrics.GetReport()["stages"]
+    if "networkRead" in stages:
+        log(f"Media threads blocked on network: {stages['networkRead']['totalSeconds']:.3f}s | disk: {stages['diskWrite']['totalSeconds']:.3f}s | write-behind: {diskWriter is not None}")
+
+    if pageCache is not None:
+        log(f"Page cache - hits: {pageCache.numHits} | misses: {pageCache.numMisses} | cacheDir: '{pageCache.cacheDir}'", logLevel=LogLevel.Verbose)
 
     return results
 
+def downloadUrlLists(urlLists:dict[str, list[str]], **downloadKwargs) -> dict[str, UrlDownloadResults]:
+    """Downloads `urlLists`, a dict of download dirs to the post urls to download into them. See downloadPosts for `downloadKwargs`"""
+
+    urlEntries = ( (downloadDir, url) for downloadDir, urls in urlLists.items() for url in urls )
+    return downloadPosts(urlEntries, list(urlLists.keys()), **downloadKwargs)
+
+def downloadUrls(urls:list[str], downloadDir:str, **downloadKwargs) -> UrlDownloadResults:
+    """Downloads a single list of post urls into `downloadDir`. See downloadPosts for `downloadKwargs`"""
+    return downloadUrlLists({downloadDir: urls}, **downloadKwargs)[downloadDir]
+
+def iterUserDataUrls(filePath:str, favoriteDir:str, likedDir:str, stream:bool) -> Iterator[tuple[str, str]]:
+    """ Yields (downloadDir, url) for the favorite and liked posts in the tiktok user data json file at `filePath`.
+        If `stream` is True the lists are streamed out of the file instead of loading the whole file first.
+    """
+
+    # Note: arrayPath -> (downloadDir, linkKey)
+    listInfos = {
+        ("Activity", "Favorite Videos", "FavoriteVideoList"): (favoriteDir, "Link"),
+        ("Activity", "Like List", "ItemFavoriteList"):        (likedDir,    "link"),
+    }
+
+    if stream:
+        with open(filePath, "r", encoding="utf-8-sig") as file:
+            for arrayPath, element in JsonStream(file).IterArrays(list(listInfos.keys())):
+                downloadDir, linkKey = listInfos[arrayPath]
+                yield downloadDir, element[linkKey]
+
+        return
+
+    with open(filePath, "rb") as file:
+        data = json.load(file)
+
+    for (activityKey, listKey, listName), (downloadDir, linkKey) in listInfos.items():
+        for element in data[activityKey][listKey][listName]:
+            yield downloadDir, element[linkKey]
+
 def main():
 
     class MainArgs(Args):        
-        file         = Arg(longName="--file",         metavar="str",        type=str,   default="./user_data_tiktok.json",  help=f"Specifies the tiktok user data json file to parse.")
-        dir          = Arg(longName="--dir",          metavar="str",        type=str,   default="./DownloadedFiles",        help=f"Specifies the folder to download the files to.")
-        threads      = Arg(longName="--threads",      metavar="int",        type=int,   default=max(32, os.cpu_count()),    help=f"Specifies the number of threads to use while downloading.")
-        proxyTimeout = Arg(longName="--proxyTimeout", metavar="float",      type=float, default=5,                          help=f"Specified the default number of seconds to wait while attempting to connect to proxies.")
-        proxy        = Arg(longName="--proxy",        metavar="list[str]",  type=str,   default=None,                       help=f"A comma separated list of preferred proxies to use. If no list is provided or all proxies fail then a free proxy from proxyscrape.com will be used.")
-        log          = Arg(longName="--log",          metavar="str",        type=str,   default="",                         help=f"Specifies an log file to write to or blank for none.")
-        verbose      = Arg(longName="--verbose",      metavar="int",        type=int,   default=LogLevel.Default,           help=f"Specifies the verbose log level. Larger values enable more verbose output. Log Levels: {LogLevel.getMapping()}")
+        file            = Arg(longName="--file",            metavar="str",       type=str,   default="./user_data_tiktok.json", help=f"Specifies the tiktok user data json file to parse.")
+        stream          = Arg(longName="--stream",          metavar="",          type=bool,  default=False,                     help=f"Streams the like and favorite lists out of --file so downloads start immediately and large files aren't loaded into memory.", action="store_true")
+        dir             = Arg(longName="--dir",             metavar="str",       type=str,   default="./DownloadedFiles",       help=f"Specifies the folder to download the files to.")
+        threads         = Arg(longName="--threads",         metavar="int",       type=int,   default=max(32, os.cpu_count()),   help=f"Specifies the number of threads used to fetch and parse post pages.")
+        downloadThreads = Arg(longName="--downloadThreads", metavar="int",       type=int,   default=max(32, os.cpu_count()),   help=f"Specifies the number of threads used to download media files.")
+        downloadQueue   = Arg(longName="--downloadQueue",   metavar="int",       type=int,   default=128,                       help=f"Specifies the maximum number of parsed media files waiting for a download thread before page parsing is paused.")
+        postDownloads   = Arg(longName="--postDownloads",   metavar="int",       type=int,   default=8,                         help=f"Specifies the maximum number of files from a single post that are downloaded concurrently.")
+        proxyTimeout    = Arg(longName="--proxyTimeout",    metavar="float",     type=float, default=5,                         help=f"Specified the default number of seconds to wait while attempting to connect to proxies.")
+        proxy           = Arg(longName="--proxy",           metavar="list[str]", type=str,   default=None,                      help=f"A comma separated list of preferred proxies to use. If no list is provided or all proxies fail then a free proxy from proxyscrape.com will be used.")
+        ledger          = Arg(longName="--ledger",          metavar="str",       type=str,   default="ledger.sqlite",           help=f"Specifies the job ledger file, relative to --dir, used to resume previous runs or blank to disable.")
+        fileIndex       = Arg(longName="--fileIndex",       metavar="str",       type=str,   default=".fileIndex.sqlite",       help=f"Specifies the index of downloaded files, relative to --dir, used to skip existing files without crawling --dir or blank to disable.")
+        poolHosts       = Arg(longName="--poolHosts",       metavar="int",       type=int,   default=SessionPool.kDefaultNumHosts, help=f"Specifies the number of hosts each shared session keeps a connection pool for.")
+        poolConnections = Arg(longName="--poolConnections", metavar="int",       type=int,   default=0,                         help=f"Specifies the number of keep-alive connections each shared session keeps per host or 0 for --threads + --downloadThreads.")
+        mediaStore      = Arg(longName="--mediaStore",      metavar="str",       type=str,   default=".mediaStore",             help=f"Specifies the folder, relative to --dir, used to store music and covers shared between posts or blank to disable.")
+        writeBehind     = Arg(longName="--writeBehind",     metavar="int",       type=int,   default=0,                         help=f"Specifies the number of MB each downloading file buffers for background disk writer threads or 0 to write chunks from the download threads. Buffered files are preallocated and synced once when closed.")
+        pageCache       = Arg(longName="--pageCache",       metavar="str",       type=str,   default=".pageCache",              help=f"Specifies the folder, relative to --dir, used to cache parsed post pages between runs or blank to disable.")
+        catalog         = Arg(longName="--catalog",         metavar="str",       type=str,   default="",                        help=f"Specifies a catalog database, relative to --dir, that post metadata, results and files are recorded to for querying (Ex: catalog.sqlite) or blank to disable. Posts still get a metadata.txt file.")
+        pageCacheTtl    = Arg(longName="--pageCacheTtl",    metavar="float",     type=float, default=24*60*60,                  help=f"Specifies the maximum number of seconds a cached post page is used. Pages expire sooner if their signed media urls do.")
+        metrics         = Arg(longName="--metrics",         metavar="str",       type=str,   default="",                        help=f"Specifies a text file, relative to --dir, that per-stage timings are periodically written to or blank to disable. A json run report is always written to runReport.json.")
+        metricsInterval = Arg(longName="--metricsInterval", metavar="float",     type=float, default=10,                        help=f"Specifies the number of seconds between updates of the --metrics file.")
+        log             = Arg(longName="--log",             metavar="str",       type=str,   default="",                        help=f"Specifies an log file to write to or blank for none.")
+        logJson         = Arg(longName="--logJson",         metavar="",          type=bool,  default=False,                     help=f"Writes the --log file as JSON Lines with thread, url and result fields.", action="store_true")
+        verbose         = Arg(longName="--verbose",         metavar="int",       type=int,   default=LogLevel.Default,          help=f"Specifies the verbose log level. Larger values enable more verbose output. Log Levels: {LogLevel.getMapping()}")
 
     argParser = ArgParser(
         description = "A lightweight python utility for downloading liked and favorited videos specified in a tiktok json files"
@@ -411,47 +928,100 @@ def main():
 
     args = argParser.Parse(MainArgs())
 
-    setLogFile(args.log.value)
+    setLogFile(args.log.value, jsonLines=args.logJson.value)
     setLogLevel(args.verbose.value)
 
-    filePath     = args.file.value
-    filePath     = args.file.value
-    numThreads   = args.threads.value
-    proxyList    = args.proxy.value
-    proxyTimeout = args.proxyTimeout.value
-    downloadDir  = args.dir.value
+    filePath           = args.file.value
+    filePath           = args.file.value
+    numThreads         = args.threads.value
+    numDownloadThreads = args.downloadThreads.value
+    downloadQueueSize  = args.downloadQueue.value
+    maxPostDownloads   = args.postDownloads.value
+    proxyList          = args.proxy.value
+    proxyTimeout       = args.proxyTimeout.value
+    downloadDir        = args.dir.value
+    ledgerFile         = args.ledger.value
+    fileIndexFile      = args.fileIndex.value
+    mediaStoreDir      = args.mediaStore.value
+    writeBehindMB      = args.writeBehind.value
+    streamFile         = args.stream.value
+    numPoolHosts       = args.poolHosts.value
+    poolConnections    = args.poolConnections.value
+    pageCacheDir       = args.pageCache.value
+    pageCacheTtl       = args.pageCacheTtl.value
+    catalogFile        = args.catalog.value
+    metricsFile        = args.metrics.value
+    metricsInterval    = args.metricsInterval.value
 
     preferredProxies = None if proxyList is None else proxyList.split(",")
 
-    # process user data
+    proxyPool = None if preferredProxies is None else createProxyPool(preferredProxies, proxyTimeout)
+    ledger = JobLedger(f"{downloadDir}/{ledgerFile}") if ledgerFile else None
+    fileIndex = FileIndex(downloadDir, f"{downloadDir}/{fileIndexFile}") if fileIndexFile else None
+    mediaStore = MediaStore(f"{downloadDir}/{mediaStoreDir}") if mediaStoreDir else None
+    diskWriter = DiskWriter(maxBufferBytes=writeBehindMB*1024*1024) if writeBehindMB > 0 else None
+    metrics = Metrics(f"{downloadDir}/{metricsFile}" if metricsFile else "", metricsInterval)
+    pageCache = PageCache(f"{downloadDir}/{pageCacheDir}", ttl=pageCacheTtl) if pageCacheDir else None
+    catalog = Catalog(f"{downloadDir}/{catalogFile}") if catalogFile else None
+    sessionPool = SessionPool(numHosts=numPoolHosts, hostConnections=(poolConnections or numThreads + numDownloadThreads))
+
+    # download files
+    favoriteDir = f"{downloadDir}/favoriteVideos"
+    likedDir    = f"{downloadDir}/likedVideos"
+
     log(f"Reading {filePath}...")
-    with open(filePath, "rb") as file:
-        data = json.load(file)
+    urlEntries = iterUserDataUrls(filePath, favoriteDir, likedDir, stream=streamFile)
 
-    likedVideoList =  data["Activity"]["Like List"]["ItemFavoriteList"]
-    likedVideoUrls = [likedVideoList[i]['link'] for i in range(0, len(likedVideoList))]
+    if fileIndex is not None:
+        fileIndex.Refresh()
 
-    favoriteVideoList = data["Activity"]["Favorite Videos"]["FavoriteVideoList"]
-    favoriteVideoUrls = [favoriteVideoList[i]['Link'] for i in range(0, len(favoriteVideoList))]
-    
-    
-    # download files
-    log("Downloading Favorites...")
-    favoriteResults = downloadUrls(favoriteVideoUrls, f"{downloadDir}/favoriteVideos", preferredProxies=preferredProxies, proxyTimeout=proxyTimeout, numThreads=numThreads)
-    favoriteResults.SaveToFile(f"{downloadDir}/favoriteVideos.log")
+    log("Downloading Favorites and Likes...")
+    listResults = downloadPosts(
+        urlEntries, [favoriteDir, likedDir],
+        proxyPool=proxyPool, numThreads=numThreads, numDownloadThreads=numDownloadThreads, downloadQueueSize=downloadQueueSize, maxPostDownloads=maxPostDownloads, ledger=ledger, fileIndex=fileIndex, mediaStore=mediaStore, diskWriter=diskWriter, sessionPool=sessionPool, pageCache=pageCache, catalog=catalog, metrics=metrics
+    )
 
-    print("\n") 
+    favoriteResults = listResults[favoriteDir]
+    favoriteResults.SaveToFile(f"{downloadDir}/favoriteVideos.log")
 
-    log(f"Downloading Likes...")
-    likedResults = downloadUrls(likedVideoUrls, f"{downloadDir}/likedVideos", preferredProxies=preferredProxies, proxyTimeout=proxyTimeout, numThreads=numThreads)
+    likedResults = listResults[likedDir]
     likedResults.SaveToFile(f"{downloadDir}/likedVideos.log")
 
+    metrics.Close()
+    metrics.SaveReport(
+        f"{downloadDir}/runReport.json",
+        results={
+            "favoriteVideos": {name: favoriteResults.GetCount(type) for type, name in DownloadResultType.getMapping().items()},
+            "likedVideos"   : {name: likedResults.GetCount(type) for type, name in DownloadResultType.getMapping().items()},
+        },
+    )
+
+    if ledger is not None:
+        ledger.Close()
+
+    if fileIndex is not None:
+        fileIndex.Close()
+
+    if diskWriter is not None:
+        diskWriter.Close()
+
+    if catalog is not None:
+        catalog.Close()
+
+    log(f"{sessionPool}")
+    sessionPool.Close()
+
+    if proxyPool is not None:
+        proxyPool.Close()
+
+    flushLog()
     print("\n")
 
     log(f"Download Results:")
     log(f"Results [Favorite Videos] - {favoriteResults}")
     log(f"Results [Liked Videos]    - {likedResults}")
 
+    flushLog()
     print("\n")
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+""" Measures end to end download throughput against a local stand-in TikTok server serving synthetic video, image carousel,
+    private, unavailable and captcha posts.
+    The server and each run are started in separate processes so CPU time and peak RSS only cover the downloader.
+    Run from the repo root: python -m benchmarks.endToEndBenchmark [--threads 1,4,16,32] [--posts 200]
+"""
+
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.stubServer import *
+from utils.ArgParser import *
+from utils.parse import parseHumanReadableSize
+
+def serverProcess_(baseUrlQueue:multiprocessing.Queue, serverKwargs:dict) -> None:
+    server = StubServer(**serverKwargs)
+    baseUrlQueue.put(server.baseUrl)
+    server.serve_forever()
+
+def runProcess_(resultQueue:multiprocessing.Queue, urls:list[str], numThreads:int, retryTimeout:float) -> None:
+
+    # Note: the downloader is imported in the run process so its import cost and memory aren't shared between runs
+    import TikTokDownloader
+
+    # Note: stdout isn't a terminal so the downloader runs headless
+    sys.stdout = open(os.devnull, "w")
+
+    downloadDir = tempfile.mkdtemp(prefix="endToEndBenchmark-")
+    try:
+        startUsage = resource.getrusage(resource.RUSAGE_SELF)
+        startTime = time.perf_counter()
+        results = TikTokDownloader.downloadUrls(
+            urls, downloadDir,
+            proxyPool=None, numThreads=numThreads, numDownloadThreads=numThreads, downloadQueueSize=4*numThreads, maxPostDownloads=8, retryTimeout=retryTimeout
+        )
+        elapsedSeconds = time.perf_counter() - startTime
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+
+        numBytes = 0
+        for dirPath, _, fileNames in os.walk(downloadDir):
+            numBytes+= sum(os.path.getsize(os.path.join(dirPath, fileName)) for fileName in fileNames)
+
+    finally:
+        shutil.rmtree(downloadDir, ignore_errors=True)
+
+    resultQueue.put({
+        "elapsedSeconds": elapsedSeconds,
+        "numBytes"      : numBytes,
+        "cpuSeconds"    : (usage.ru_utime + usage.ru_stime) - (startUsage.ru_utime + startUsage.ru_stime),
+
+        # Note: ru_maxrss is in KB on linux and bytes on macOS
+        "peakRssBytes"  : usage.ru_maxrss if sys.platform == "darwin" else 1024*usage.ru_maxrss,
+        "resultCounts"  : {name: results.GetCount(type) for type, name in TikTokDownloader.DownloadResultType.getMapping().items()},
+    })
+
+def main():
+
+    class BenchmarkArgs(Args):
+        threads      = Arg(longName="--threads",      metavar="list[int]", type=str,   default="1,4,16,32",  help=f"A comma separated list of thread counts to benchmark. Each run uses the count for both --threads and --downloadThreads.")
+        posts        = Arg(longName="--posts",        metavar="int",       type=int,   default=200,          help=f"Specifies the number of posts downloaded by each run.")
+        videoSize    = Arg(longName="--videoSize",    metavar="int",       type=int,   default=2*1024*1024,  help=f"Specifies the size in bytes of each synthetic video.")
+        imageSize    = Arg(longName="--imageSize",    metavar="int",       type=int,   default=200*1024,     help=f"Specifies the size in bytes of each synthetic image, music file and music cover.")
+        images       = Arg(longName="--images",       metavar="int",       type=int,   default=5,            help=f"Specifies the number of images in each carousel post.")
+        latency      = Arg(longName="--latency",      metavar="float",     type=float, default=0.02,         help=f"Specifies the number of seconds the server waits before answering each request.")
+        retryTimeout = Arg(longName="--retryTimeout", metavar="float",     type=float, default=0.1,          help=f"Specifies the number of seconds the downloader waits before retrying a captcha page.")
+
+    args = ArgParser(description="Benchmarks end to end downloads against a local stand-in TikTok server").Parse(BenchmarkArgs())
+
+    threadCounts = [int(numThreads) for numThreads in args.threads.value.split(",")]
+    numPosts = args.posts.value
+
+    serverKwargs = {
+        "videoSize": args.videoSize.value,
+        "imageSize": args.imageSize.value,
+        "numImages": args.images.value,
+        "latency"  : args.latency.value,
+    }
+
+    baseUrlQueue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serverProcess_, args=(baseUrlQueue, serverKwargs), daemon=True)
+    server.start()
+    baseUrl = baseUrlQueue.get()
+
+    print(f"Server: {baseUrl} | posts: {numPosts} | kinds: {kPostKindResults} | {serverKwargs}")
+    print(f"{'Threads':>8} {'Posts/s':>10} {'MB/s':>10} {'Elapsed':>10} {'CPU':>10} {'CPU/Post':>10} {'Peak RSS':>14}  Results")
+
+    # Note: every run uses new post ids so captcha posts are blocked again and pages aren't served from the server cache
+    firstPost = 0
+    for numThreads in threadCounts:
+        urls = makePostUrls(baseUrl, numPosts, firstPost)
+        firstPost+= numPosts + (-numPosts % len(kPostKinds))
+
+        resultQueue = multiprocessing.Queue()
+        run = multiprocessing.Process(target=runProcess_, args=(resultQueue, urls, numThreads, args.retryTimeout.value))
+        run.start()
+        run.join()
+
+        if run.exitcode != 0:
+            print(f"{numThreads:>8} run failed with exit code {run.exitcode}")
+            continue
+
+        result = resultQueue.get()
+
+        elapsedSeconds = result["elapsedSeconds"]
+        resultCounts = " - ".join(f"{name}: {count}" for name, count in result["resultCounts"].items() if count > 0)
+
+        print(
+            f"{numThreads:>8} {numPosts/elapsedSeconds:>10.2f} {result['numBytes']/elapsedSeconds/(1024*1024):>10.2f} {elapsedSeconds:>9.3f}s "
+            f"{result['cpuSeconds']:>9.3f}s {1000*result['cpuSeconds']/numPosts:>8.3f}ms {parseHumanReadableSize(result['peakRssBytes']):>14}  {resultCounts}"
+        )
+
+    server.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+""" Measures ParsableDictionary.parse on a realistic itemStruct by extracting the same fields as parseUrlThread_.
+    Posts are extracted through both a copying ParsableDictionary and a zero-copy ParsableDictionaryView and the
+    bytes each allocates per post are measured with tracemalloc.
+    Run from the repo root: python -m benchmarks.parseDictionaryBenchmark [--iterations 2000]
+"""
+
+import timeit
+import tracemalloc
+
+from benchmarks.synthetic import *
+from utils.ArgParser import *
+from utils.parse import *
+
+def extractPost(detail:ParsableDictionary|ParsableDictionaryView) -> list:
+    """Parses the fields parseUrlThread_ reads from webapp.video-detail and returns the parsed values"""
+
+    values = [detail.parse("statusCode", int)]
+
+    itemInfo   = detail.parse("itemInfo", ParsableDictionary)
+    itemStruct = itemInfo.parse("itemStruct", ParsableDictionary)
+    values.append(itemStruct.parseDefault("isContentClassified", False))
+
+    videoInfo  = itemStruct.parse("video",  ParsableDictionary)
+    musicInfo  = itemStruct.parse("music",  ParsableDictionary)
+    authorInfo = itemStruct.parse("author", ParsableDictionary)
+
+    values+= [
+        itemStruct.parse("id", str),
+        itemStruct.parse("createTime", int),
+        itemStruct.parse("comments", list[str]),
+        itemStruct.parseDefault("suggestedWords", []),
+        itemStruct.parse("locationCreated"),
+        itemStruct.parse("desc"),
+
+        authorInfo.parse("uniqueId"),
+        authorInfo.parse("nickname"),
+        authorInfo.parse("signature"),
+
+        musicInfo.parse("playUrl"),
+        musicInfo.parse("coverLarge"),
+        musicInfo.parse("title"),
+        musicInfo.parseDefault("authorName", "N/A"),
+        musicInfo.parseDefault("album", "N/A"),
+        musicInfo.parseDefault("id", ""),
+
+        videoInfo.parse("playAddr"),
+        videoInfo.parse("format"),
+    ]
+
+    imagePost = itemStruct.parseDefault("imagePost", None, ParsableDictionary)
+    for image in imagePost.parse("images", list[ParsableDictionary]):
+        values.append(image.parse("imageURL", ParsableDictionary).parse("urlList", list[str]))
+
+    return values
+
+def measureAllocations(detail:ParsableDictionary|ParsableDictionaryView, iterations:int) -> tuple[float, float]:
+    """Returns the mean (retainedBytes, peakBytes) allocated by extractPost(detail) while its parsed values are alive"""
+
+    retainedBytes = 0
+    peakBytes = 0
+
+    tracemalloc.start()
+    for _ in range(iterations):
+        tracemalloc.reset_peak()
+        startBytes, _ = tracemalloc.get_traced_memory()
+
+        values = extractPost(detail)
+
+        endBytes, endPeakBytes = tracemalloc.get_traced_memory()
+        retainedBytes+= endBytes - startBytes
+        peakBytes+= endPeakBytes - startBytes
+
+        del values
+
+    tracemalloc.stop()
+
+    return retainedBytes / iterations, peakBytes / iterations
+
+def main():
+
+    class BenchmarkArgs(Args):
+        iterations = Arg(longName="--iterations", metavar="int", type=int, default=2000, help=f"Specifies the number of times the post is parsed.")
+        images     = Arg(longName="--images",     metavar="int", type=int, default=10,   help=f"Specifies the number of images in the synthetic post.")
+        comments   = Arg(longName="--comments",   metavar="int", type=int, default=100,  help=f"Specifies the number of comments in the synthetic post.")
+
+    args = ArgParser(description="Benchmarks ParsableDictionary.parse on a synthetic itemStruct").Parse(BenchmarkArgs())
+
+    iterations = args.iterations.value
+    itemStruct = makeItemStruct("7300000000000000001", "https://example.com", numImages=args.images.value, numComments=args.comments.value)
+    videoDetail = makeVideoDetail(itemStruct=itemStruct)
+    detail = ParsableDictionary(videoDetail)
+    detailView = ParsableDictionaryView(videoDetail)
+
+    # Note: string annotations are resolved from the caller's module which is the slow path of parseType
+    stringListT = list["ParsableDictionary"]
+    images = itemStruct["imagePost"]["images"]
+
+    postSeconds = timeit.timeit(lambda: extractPost(detail), number=iterations) / iterations
+    viewPostSeconds = timeit.timeit(lambda: extractPost(detailView), number=iterations) / iterations
+    typeSeconds = timeit.timeit(lambda: parseType("ParsableDictionary"), number=iterations) / iterations
+    stringListSeconds = timeit.timeit(lambda: parseValue(images, stringListT), number=iterations) / iterations
+
+    # Note: tracemalloc slows down allocations so it's measured separately from the timings
+    allocationIterations = max(1, iterations // 10)
+    retainedBytes, peakBytes = measureAllocations(detail, allocationIterations)
+    viewRetainedBytes, viewPeakBytes = measureAllocations(detailView, allocationIterations)
+
+    print(f"itemStruct [{args.images.value} images, {args.comments.value} comments]")
+    print(f"\textractPost(ParsableDictionary):                {1e6*postSeconds:10.3f} us/post | {retainedBytes:10.0f} B retained/post | {peakBytes:10.0f} B peak/post")
+    print(f"\textractPost(ParsableDictionaryView):            {1e6*viewPostSeconds:10.3f} us/post | {viewRetainedBytes:10.0f} B retained/post | {viewPeakBytes:10.0f} B peak/post")
+    print(f"\tparseType('ParsableDictionary'):                {1e6*typeSeconds:10.3f} us/call")
+    print(f"\tparseValue(images, list['ParsableDictionary']): {1e6*stringListSeconds:10.3f} us/call")
+
+if __name__ == "__main__":
+    main()
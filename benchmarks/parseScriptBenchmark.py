@@ -0,0 +1,46 @@
+""" Compares the fast byte scanning parseHtmlScriptText extractor with the BeautifulSoup parseHtmlElement path.
+    Run from the repo root: python -m benchmarks.parseScriptBenchmark [--pages page1.html,page2.html]
+"""
+
+import timeit
+
+from benchmarks.synthetic import *
+from utils.ArgParser import *
+from utils.parse import *
+
+kScriptId = "__UNIVERSAL_DATA_FOR_REHYDRATION__"
+
+def main():
+
+    class BenchmarkArgs(Args):
+        pages      = Arg(longName="--pages",      metavar="list[str]", type=str, default=None, help=f"A comma separated list of saved post pages to benchmark. If no list is provided a synthetic page is used.")
+        iterations = Arg(longName="--iterations", metavar="int",       type=int, default=20,   help=f"Specifies the number of times each page is parsed by each extractor.")
+
+    args = ArgParser(description="Benchmarks __UNIVERSAL_DATA_FOR_REHYDRATION__ script extraction").Parse(BenchmarkArgs())
+
+    iterations = args.iterations.value
+    if args.pages.value is None:
+        pages = {"synthetic": makePostPage(makeVideoDetail(itemStruct=makeItemStruct("7300000000000000001", "https://example.com", numImages=10)))}
+    else:
+        pages = {}
+        for pagePath in args.pages.value.split(","):
+            with open(pagePath, "rb") as file:
+                pages[pagePath] = file.read()
+
+    for name, html in pages.items():
+
+        soupText = parseHtmlElement(html, "script", {"id": kScriptId}).text
+        fastText = parseHtmlScriptText(html, kScriptId)
+        if soupText != fastText:
+            print(f"WARNING: extractors disagree on '{name}'")
+
+        soupSeconds = timeit.timeit(lambda: parseHtmlElement(html, "script", {"id": kScriptId}), number=iterations) / iterations
+        fastSeconds = timeit.timeit(lambda: parseHtmlScriptText(html, kScriptId), number=iterations) / iterations
+
+        print(f"{name} [{parseHumanReadableSize(len(html))}]")
+        print(f"\tparseHtmlElement:    {1000*soupSeconds:10.3f} ms/page")
+        print(f"\tparseHtmlScriptText: {1000*fastSeconds:10.3f} ms/page")
+        print(f"\tspeedup:             {soupSeconds/fastSeconds:10.1f}x")
+
+if __name__ == "__main__":
+    main()
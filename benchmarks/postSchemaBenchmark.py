@@ -0,0 +1,71 @@
+""" Measures the per-post cost of reading the fields of an itemStruct with the compiled kPostSchema extractor against
+    reading them with individual ParsableDictionary / ParsableDictionaryView parse calls.
+    Run from the repo root: python -m benchmarks.postSchemaBenchmark [--iterations 5000]
+"""
+
+import timeit
+
+from benchmarks.synthetic import *
+from utils.ArgParser import *
+from utils.parse import *
+from utils.PostSchema import *
+
+def parsePost(itemStruct:ParsableDictionary|ParsableDictionaryView) -> list:
+    """Reads the fields of kPostSchema with individual parse calls the way parseUrlThread_ used to"""
+
+    videoInfo  = itemStruct.parse("video",  ParsableDictionary)
+    musicInfo  = itemStruct.parse("music",  ParsableDictionary)
+    authorInfo = itemStruct.parse("author", ParsableDictionary)
+
+    values = [
+        parseStripedHtmlString(itemStruct.parse("id", str)),
+        itemStruct.parse("createTime", int),
+        itemStruct.parse("comments", list[str]),
+        itemStruct.parseDefault("suggestedWords", []),
+        parseStripedHtmlString(itemStruct.parse("locationCreated")),
+        parseStripedHtmlString(itemStruct.parse("desc")),
+
+        parseStripedHtmlString(authorInfo.parse("uniqueId")),
+        parseStripedHtmlString(authorInfo.parse("nickname")),
+        parseStripedHtmlString(authorInfo.parse("signature")),
+
+        parseStripedHtmlString(musicInfo.parse("playUrl")),
+        parseStripedHtmlString(musicInfo.parse("coverLarge")),
+        parseStripedHtmlString(musicInfo.parse("title")),
+        parseStripedHtmlString(musicInfo.parseDefault("authorName", "N/A")),
+        parseStripedHtmlString(musicInfo.parseDefault("album", "N/A")),
+        parseStripedHtmlString(str(musicInfo.parseDefault("id", ""))),
+
+        parseStripedHtmlString(videoInfo.parse("playAddr")),
+        parseStripedHtmlString(videoInfo.parse("format")),
+    ]
+
+    imagePost = itemStruct.parseDefault("imagePost", None, ParsableDictionary)
+    if imagePost is not None:
+        values.append([image.parse("imageURL", ParsableDictionary).parse("urlList", list[str]) for image in imagePost.parse("images", list[ParsableDictionary])])
+
+    return values
+
+def main():
+
+    class BenchmarkArgs(Args):
+        iterations = Arg(longName="--iterations", metavar="int", type=int, default=5000, help=f"Specifies the number of times each post is extracted.")
+        comments   = Arg(longName="--comments",   metavar="int", type=int, default=100,  help=f"Specifies the number of comments in the synthetic posts.")
+
+    args = ArgParser(description="Benchmarks the compiled post schema extractor on synthetic itemStructs").Parse(BenchmarkArgs())
+
+    iterations = args.iterations.value
+
+    print(f"{'Post':<24} {'ParsableDictionary':>20} {'View':>12} {'Schema':>12} {'Speedup':>9}")
+    for numImages in [0, 10]:
+        itemStruct = makeItemStruct("7300000000000000001", "https://example.com", numImages=numImages, numComments=args.comments.value)
+
+        dictSeconds   = timeit.timeit(lambda: parsePost(ParsableDictionary(itemStruct)), number=iterations) / iterations
+        viewSeconds   = timeit.timeit(lambda: parsePost(ParsableDictionaryView(itemStruct)), number=iterations) / iterations
+        schemaSeconds = timeit.timeit(lambda: extractPost(itemStruct), number=iterations) / iterations
+
+        postName = f"{numImages} images, {args.comments.value} comments"
+        print(f"{postName:<24} {1e6*dictSeconds:>15.3f} us/post {1e6*viewSeconds:>7.3f} us/post {1e6*schemaSeconds:>7.3f} us/post {min(dictSeconds, viewSeconds)/schemaSeconds:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
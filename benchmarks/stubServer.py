@@ -0,0 +1,149 @@
+""" Local stand-in for TikTok that serves synthetic post pages and media.
+    The kind of each post is derived from its id so the server needs no shared state with the client:
+    kind = kPostKinds[(postId - kBasePostId) % len(kPostKinds)]
+"""
+
+import re
+import threading
+import time
+
+from benchmarks.synthetic import *
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+kBasePostId = 7300000000000000000
+
+# Note: mix of post kinds in the order they are assigned to consecutive post ids
+kPostKinds = ["video"]*12 + ["carousel"]*4 + ["private"] + ["unavailable"]*2 + ["captcha"]
+
+# Note: expected download result of each post kind. Captcha posts are served a captcha page on their first request only
+kPostKindResults = {
+    "video"      : "DownloadedVideo",
+    "carousel"   : "DownloadedImage",
+    "private"    : "Private",
+    "unavailable": "NotAvailable",
+    "captcha"    : "DownloadedVideo",
+}
+
+gPageRegex  = re.compile(r"/@[^/]+/video/(\d+)")
+gRangeRegex = re.compile(r"bytes=(\d+)-")
+
+def getPostKind(postId:int) -> str:
+    return kPostKinds[(postId - kBasePostId) % len(kPostKinds)]
+
+def makePostUrls(baseUrl:str, numPosts:int, firstPost:int = 0) -> list[str]:
+    """ Returns the urls of `numPosts` posts starting at post number `firstPost`. 
+        Note: `firstPost` should be a multiple of len(kPostKinds) to keep the mix of post kinds
+    """
+    return [f"{baseUrl}/@user/video/{kBasePostId + i}" for i in range(firstPost, firstPost + numPosts)]
+
+class StubServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, port:int = 0, videoSize:int = 2*1024*1024, imageSize:int = 200*1024, numImages:int = 5, latency:float = 0) -> None:
+        super().__init__(("127.0.0.1", port), StubRequestHandler)
+
+        self.baseUrl = f"http://127.0.0.1:{self.server_address[1]}"
+        self.videoSize = videoSize
+        self.imageSize = imageSize
+        self.numImages = numImages
+        self.latency = latency
+
+        self.media = b"\0" * max(videoSize, imageSize)
+
+        self.lock = threading.Lock()
+        self.pages:dict[int, bytes] = {}
+        self.captchaPostIds:set[int] = set()
+
+    def GetPage(self, postId:int) -> bytes:
+        kind = getPostKind(postId)
+
+        with self.lock:
+            if kind == "captcha" and postId not in self.captchaPostIds:
+                self.captchaPostIds.add(postId)
+                return makeCaptchaPage()
+
+            page = self.pages.get(postId)
+
+        if page is not None:
+            return page
+
+        if kind == "private":
+            videoDetail = makeVideoDetail(statusCode=10222)
+
+        elif kind == "unavailable":
+            videoDetail = makeVideoDetail(statusCode=10204)
+
+        elif kind == "carousel":
+            itemStruct = makeItemStruct(str(postId), self.baseUrl, numImages=self.numImages)
+            itemStruct["video"]["playAddr"] = ""
+            videoDetail = makeVideoDetail(itemStruct=itemStruct)
+
+        else:
+            videoDetail = makeVideoDetail(itemStruct=makeItemStruct(str(postId), self.baseUrl))
+
+        page = makePostPage(videoDetail)
+        with self.lock:
+            self.pages[postId] = page
+
+        return page
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+
+    # Note: HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        server:StubServer = self.server
+
+        if server.latency > 0:
+            time.sleep(server.latency)
+
+        pageMatch = gPageRegex.match(self.path)
+        if pageMatch is not None:
+            self._Send(200, server.GetPage(int(pageMatch.group(1))), "text/html; charset=utf-8")
+            return
+
+        if self.path.startswith("/media/"):
+            self._SendMedia(server.videoSize if self.path.startswith("/media/video/") else server.imageSize)
+            return
+
+        self._Send(404, b"Not Found", "text/plain")
+
+    def _SendMedia(self, size:int) -> None:
+        startByte = 0
+        etag = f'"media-{size}"'
+
+        # Note: ranges are only served if the If-Range validator, when sent, matches the media
+        rangeMatch = gRangeRegex.match(self.headers.get("Range", ""))
+        if rangeMatch is not None and self.headers.get("If-Range", etag) != etag:
+            rangeMatch = None
+
+        if rangeMatch is not None:
+            startByte = int(rangeMatch.group(1))
+            if startByte >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        self.send_response(206 if startByte > 0 else 200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(size - startByte))
+        self.send_header("ETag", etag)
+        if startByte > 0:
+            self.send_header("Content-Range", f"bytes {startByte}-{size-1}/{size}")
+        self.end_headers()
+
+        self.wfile.write(memoryview(self.server.media)[startByte:size])
+
+    def _Send(self, status:int, body:bytes, contentType:str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format:str, *args) -> None:
+        pass
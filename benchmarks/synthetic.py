@@ -0,0 +1,82 @@
+import json
+import random
+
+# Note: real post pages are ~300KB of markup, styles and scripts around the rehydration script so we pad
+#       synthetic pages with similar content to keep parse timings representative
+kFillerMarkup = "".join(
+    f'<div class="css-{i:04x}-DivContainer e1cg0wnj{i % 10}"><a href="/tag/{i}" data-e2e="search-common-link"><span>#tag{i}</span></a></div>\n'
+    for i in range(1500)
+)
+kFillerScript = "window.__filler = [" + ",".join(f'{{"k":{i},"v":"{"x"*24}"}}' for i in range(2000)) + "];"
+
+def makeItemStruct(postId:str, baseUrl:str, numImages:int = 0, numComments:int = 20, musicId:str = "7000000000000000001") -> dict:
+    """Returns a synthetic itemStruct shaped like the one in TikTok's __UNIVERSAL_DATA_FOR_REHYDRATION__ script"""
+
+    itemStruct = {
+        "id": postId,
+        "desc": f"Synthetic post {postId} &amp; some <b>html</b> #fyp #synthetic ✨",
+        "createTime": 1700000000 + int(postId) % 1000000,
+        "locationCreated": "US",
+        "isContentClassified": False,
+        "suggestedWords": [f"keyword {i}" for i in range(5)],
+        "comments": [f"comment {i} on {postId}" for i in range(numComments)],
+        "author": {
+            "id": "6800000000000000000",
+            "uniqueId": f"user_{int(postId) % 97}",
+            "nickname": "Synthetic User",
+            "signature": "line one\nline two",
+        },
+        "music": {
+            "id": musicId,
+            "title": f"original sound - {musicId[-4:]}",
+            "authorName": "Synthetic Artist",
+            "album": "",
+            "playUrl": f"{baseUrl}/media/music/{musicId}.mp3?expire=4102444800",
+            "coverLarge": f"{baseUrl}/media/cover/{musicId}.jpeg?x-expires=4102444800",
+        },
+        "video": {
+            "playAddr": f"{baseUrl}/media/video/{postId}.mp4?expire=4102444800",
+            "format": "mp4",
+            "duration": 15,
+        },
+        "stats": {"diggCount": random.randint(0, 10**6), "shareCount": 10, "commentCount": numComments},
+    }
+
+    if numImages > 0:
+        itemStruct["imagePost"] = {
+            "images": [
+                {"imageURL": {"urlList": [f"{baseUrl}/media/image/{postId}-{i}.jpeg?x-expires=4102444800", f"{baseUrl}/backup/{postId}-{i}.jpeg"]}, "imageWidth": 1080, "imageHeight": 1920}
+                for i in range(numImages)
+            ]
+        }
+
+    return itemStruct
+
+def makeVideoDetail(statusCode:int = 0, itemStruct:dict|None = None) -> dict:
+    videoDetail = {"statusCode": statusCode, "statusMsg": ""}
+    if itemStruct is not None:
+        videoDetail["itemInfo"] = {"itemStruct": itemStruct}
+
+    return videoDetail
+
+def makePostPage(videoDetail:dict) -> bytes:
+    """Returns the html of a post page with `videoDetail` stored in its __UNIVERSAL_DATA_FOR_REHYDRATION__ script"""
+
+    scriptJson = json.dumps({"__DEFAULT_SCOPE__": {"webapp.app-context": {"language": "en"}, "webapp.video-detail": videoDetail}}, ensure_ascii=False)
+
+    return (
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>TikTok</title>'
+        f'<style>{".a{color:red}" * 2000}</style>'
+        f'<script>{kFillerScript}</script>'
+        '</head><body>'
+        f'{kFillerMarkup}'
+        f'<script id="__UNIVERSAL_DATA_FOR_REHYDRATION__" type="application/json">{scriptJson}</script>'
+        '<script src="/static/main.js" async></script>'
+        '</body></html>'
+    ).encode("utf-8")
+
+def makeCaptchaPage() -> bytes:
+    return (
+        '<!DOCTYPE html><html><head><title>Security Check</title></head>'
+        '<body><div id="captcha-verify-container"><p>Drag the slider to fit the puzzle</p></div></body></html>'
+    ).encode("utf-8")
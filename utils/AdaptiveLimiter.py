@@ -0,0 +1,69 @@
+import threading
+
+from collections import deque
+from utils.logging import *
+
+class AdaptiveLimiter:
+    """ AIMD (additive increase, multiplicative decrease) limit on the number of in-flight requests shared between threads.
+        The limit grows by ~1 for every `limit` successful requests and is multiplied by `decreaseFactor` when a request is blocked.
+    """
+
+    def __init__(self, maxLimit:int, minLimit:int = 1, decreaseFactor:float = 0.5, windowSize:int = 100) -> None:
+        self.maxLimit = maxLimit
+        self.minLimit = min(minLimit, maxLimit)
+        self.decreaseFactor = decreaseFactor
+
+        self.condition = threading.Condition()
+        self.limit:float = maxLimit
+        self.numInFlight = 0
+
+        # Note: epoch is incremented on every decrease so a burst of blocked requests that were all
+        #       in flight before the decrease only shrinks the limit once
+        self.epoch = 0
+
+        # Note: outcomes holds True for each of the last windowSize requests that was blocked
+        self.outcomes:deque[bool] = deque(maxlen=windowSize)
+
+    def Acquire(self) -> int:
+        """Blocks until a request slot is available and returns the epoch to pass to Release"""
+
+        with self.condition:
+            while self.numInFlight >= int(self.limit):
+                self.condition.wait()
+
+            self.numInFlight+= 1
+            return self.epoch
+
+    def Release(self, epoch:int, isBlocked:bool|None) -> None:
+        """ Releases a request slot acquired at `epoch` and adjusts the limit by the outcome of the request.
+            `isBlocked` is None for requests that failed for reasons unrelated to blocking (Ex: connection errors) and leaves the limit unchanged.
+        """
+
+        with self.condition:
+            self.numInFlight-= 1
+
+            if isBlocked is not None:
+                self.outcomes.append(isBlocked)
+
+            if isBlocked is True:
+                if epoch == self.epoch:
+                    self.epoch+= 1
+                    self.limit = max(self.minLimit, self.limit * self.decreaseFactor)
+                    log(f"Request blocked. Decreased concurrency limit to {int(self.limit)} | blockRate: {self.GetBlockRate():.2%}", logLevel=LogLevel.Verbose)
+
+            elif isBlocked is False:
+                self.limit = min(self.maxLimit, self.limit + 1/self.limit)
+
+            self.condition.notify_all()
+
+    def GetLimit(self) -> int:
+        return int(self.limit)
+
+    def GetBlockRate(self) -> float:
+        """Returns the fraction of the recent requests that were blocked"""
+
+        numOutcomes = len(self.outcomes)
+        return sum(self.outcomes) / numOutcomes if numOutcomes > 0 else 0
+
+    def __str__(self) -> str:
+        return f"Concurrency: {self.numInFlight}/{int(self.limit)} | Block Rate: {100*self.GetBlockRate():.2f}%"
@@ -0,0 +1,178 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+from time import time
+from utils.PostSchema import PostRecord
+from utils.logging import *
+
+class Catalog:
+    """ Sqlite catalog of the metadata, results and files of downloaded posts, indexed by post, user and music id.
+        Holds the same fields as each post's metadata.txt so questions like "which posts use sound X" or "what failed
+        last run" are a single query instead of a walk over every post dir.
+        Records are inserted in batches of up to kBatchSize per transaction by a background writer thread.
+
+        Ex: SELECT url, resultName FROM results WHERE runTime = (SELECT MAX(runTime) FROM results) AND resultName != 'DownloadedVideo'
+    """
+
+    kSchema = """
+        CREATE TABLE IF NOT EXISTS posts (
+            postId        TEXT    PRIMARY KEY,
+            url           TEXT    NOT NULL,
+            saveDir       TEXT    NOT NULL,
+            timestamp     INTEGER NOT NULL,
+            location      TEXT    NOT NULL,
+            description   TEXT    NOT NULL,
+            userId        TEXT    NOT NULL,
+            userNickname  TEXT    NOT NULL,
+            userSignature TEXT    NOT NULL,
+            musicId       TEXT    NOT NULL,
+            musicName     TEXT    NOT NULL,
+            musicArtist   TEXT    NOT NULL,
+            musicAlbum    TEXT    NOT NULL,
+            musicUrl      TEXT    NOT NULL,
+            musicCoverUrl TEXT    NOT NULL,
+            keywords      TEXT    NOT NULL,
+            comments      TEXT    NOT NULL,
+            updateTime    REAL    NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS results (
+            postId        TEXT    NOT NULL,
+            downloadDir   TEXT    NOT NULL,
+            url           TEXT    NOT NULL,
+            resultType    INTEGER NOT NULL,
+            resultName    TEXT    NOT NULL,
+            runTime       REAL    NOT NULL,
+            updateTime    REAL    NOT NULL,
+            PRIMARY KEY (postId, downloadDir)
+        );
+
+        CREATE TABLE IF NOT EXISTS files (
+            savePath      TEXT    PRIMARY KEY,
+            postId        TEXT    NOT NULL,
+            numBytes      INTEGER NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS postsUserIdIndex ON posts(userId);
+        CREATE INDEX IF NOT EXISTS postsMusicIdIndex ON posts(musicId);
+        CREATE INDEX IF NOT EXISTS resultsRunTimeIndex ON results(runTime, resultType);
+        CREATE INDEX IF NOT EXISTS filesPostIdIndex ON files(postId);
+    """
+
+    kInsertPostSql = """
+        INSERT OR REPLACE INTO posts (
+            postId, url, saveDir, timestamp, location, description, userId, userNickname, userSignature,
+            musicId, musicName, musicArtist, musicAlbum, musicUrl, musicCoverUrl, keywords, comments, updateTime
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    kInsertResultSql = "INSERT OR REPLACE INTO results (postId, downloadDir, url, resultType, resultName, runTime, updateTime) VALUES (?, ?, ?, ?, ?, ?, ?)"
+    kInsertFileSql   = "INSERT OR REPLACE INTO files (savePath, postId, numBytes) VALUES (?, ?, ?)"
+
+    kBatchSize = 256
+
+    def __init__(self, filePath:str) -> None:
+        self.filePath = filePath
+
+        # Note: runTime identifies the results of this run
+        self.runTime = time()
+
+        fileDir = os.path.dirname(filePath)
+        if fileDir:
+            os.makedirs(fileDir, exist_ok=True)
+
+        # Note: the connection is only used by the writer thread after the schema is created
+        self.connection = sqlite3.connect(filePath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(Catalog.kSchema)
+        self.connection.commit()
+
+        # Note: recordQueue holds (sql, params) records or None to stop the writer thread
+        self.recordQueue = queue.SimpleQueue()
+        self.writerThread = threading.Thread(target=self._WriterThread, name="CatalogWriter", daemon=True)
+        self.writerThread.start()
+
+        log(f"Opened catalog: '{filePath}'", logLevel=LogLevel.Verbose)
+
+    def AddPost(self, postId:str, url:str, saveDir:str, post:PostRecord) -> None:
+        """Queues the metadata of a parsed post"""
+
+        self.recordQueue.put((
+            Catalog.kInsertPostSql,
+            (
+                postId, url, saveDir, post.timestamp, post.location, post.description, post.userId, post.userNickname, post.userSignature,
+                post.musicId, post.musicName, post.musicArtist, post.musicAlbum, post.musicUrl, post.musicCoverUrl,
+                json.dumps(list(post.keywords)), json.dumps(post.comments), time()
+            )
+        ))
+
+    def AddResult(self, postId:str, downloadDir:str, url:str, resultType:int, resultName:str, savePaths:list[str]) -> None:
+        """Queues the result of a post in `downloadDir` and the files saved for it. File sizes are read by the writer thread"""
+
+        self.recordQueue.put((Catalog.kInsertResultSql, (postId, downloadDir, url, int(resultType), resultName, self.runTime, time())))
+
+        for savePath in savePaths:
+            self.recordQueue.put((Catalog.kInsertFileSql, (savePath, postId)))
+
+    def Close(self) -> None:
+        """Writes the queued records and stops the writer thread"""
+
+        if not self.writerThread.is_alive():
+            return
+
+        self.recordQueue.put(None)
+        self.writerThread.join()
+        self.connection.close()
+
+    def _WriterThread(self) -> None:
+        isClosing = False
+        while not isClosing:
+
+            # grab a batch of records
+            records = [self.recordQueue.get()]
+            while len(records) < Catalog.kBatchSize:
+                try:
+                    records.append(self.recordQueue.get_nowait())
+                except queue.Empty:
+                    break
+
+            statements = []
+            for record in records:
+                if record is None:
+                    isClosing = True
+                    continue
+
+                sql, params = record
+
+                # Note: file sizes are read here so the scheduler doesn't pay for the stat
+                if sql is Catalog.kInsertFileSql:
+                    params = params + (self._GetFileSize(params[0]),)
+
+                statements.append( (sql, params) )
+
+            try:
+                with self.connection:
+                    for sql, params in statements:
+                        self.connection.execute(sql, params)
+
+            # Note: a failed batch is rolled back so its records are written again one per transaction and only bad records are dropped
+            except Exception as e:
+                log(f"Failed to write batch of {len(statements)} records to catalog: '{self.filePath}'. Retrying records one at a time | Exception: {e}", logLevel=LogLevel.Verbose)
+
+                for sql, params in statements:
+                    try:
+                        with self.connection:
+                            self.connection.execute(sql, params)
+
+                    except Exception as e:
+                        error(f"Failed to write record to catalog: '{self.filePath}' | postId: {params[0] if sql is not Catalog.kInsertFileSql else params[1]} | Exception: {e}")
+
+    @staticmethod
+    def _GetFileSize(filePath:str) -> int:
+        try:
+            return os.path.getsize(filePath)
+        except OSError:
+            return -1
@@ -0,0 +1,169 @@
+import os
+import queue
+import threading
+
+from collections import deque
+from utils.logging import *
+
+class WriteBehindFile:
+    """ Binary file opened by DiskWriter. write() buffers chunks for the writer threads and only blocks while the file
+        already has `maxBufferBytes` waiting to be written. close() blocks until every chunk is written and synced to disk.
+    """
+
+    def __init__(self, diskWriter:"DiskWriter", path:str, append:bool, preallocateBytes:int) -> None:
+        self.diskWriter = diskWriter
+        self.path = path
+
+        # Note: preallocated files grow to their full size immediately, so they are written under kPreallocateExtension
+        #       until they're closed and truncated to the bytes written. Otherwise an interrupted run would leave a
+        #       full size file at `path` that looks complete to a resumed download
+        self.preallocateBytes = preallocateBytes if (preallocateBytes > 0 and not append and hasattr(os, "posix_fallocate")) else 0
+        self.writePath = path + DiskWriter.kPreallocateExtension if self.preallocateBytes > 0 else path
+
+        self.file = open(self.writePath, "ab" if append else "wb", buffering=0)
+        self.numBytesWritten = 0
+
+        if self.preallocateBytes > 0:
+            try:
+                os.posix_fallocate(self.file.fileno(), 0, self.preallocateBytes)
+
+            except OSError as e:
+                log(f"Failed to preallocate {self.preallocateBytes} bytes for '{path}' | Exception: {e}", logLevel=LogLevel.Verbose)
+
+        self.condition = threading.Condition()
+        self.chunks:deque[bytes] = deque()
+        self.numBufferedBytes = 0
+
+        # Note: isScheduled is True while the file is in the writer queue or being written by a writer thread
+        #       so only one writer thread writes the file at a time and its chunks stay in order
+        self.isScheduled = False
+        self.isClosing = False
+        self.closedEvent = threading.Event()
+        self.exception:Exception|None = None
+
+    def write(self, chunk:bytes) -> int:
+        with self.condition:
+            while self.numBufferedBytes > 0 and self.numBufferedBytes + len(chunk) > self.diskWriter.maxBufferBytes and self.exception is None:
+                self.condition.wait()
+
+            if self.exception is not None:
+                raise self.exception
+
+            self.chunks.append(chunk)
+            self.numBufferedBytes+= len(chunk)
+            self._Schedule()
+
+        return len(chunk)
+
+    def close(self) -> None:
+        with self.condition:
+            if not self.isClosing:
+                self.isClosing = True
+                self._Schedule()
+
+        self.closedEvent.wait()
+
+        if self.exception is not None:
+            raise self.exception
+
+    def __enter__(self) -> "WriteBehindFile":
+        return self
+
+    def __exit__(self, *exceptionInfo) -> None:
+        self.close()
+
+    def _Schedule(self) -> None:
+        """Queues the file for a writer thread. Must be called with self.condition held"""
+
+        if not self.isScheduled:
+            self.isScheduled = True
+            self.diskWriter.fileQueue.put(self)
+
+    def _Write(self) -> None:
+        """Writes the buffered chunks of the file. Called by a writer thread"""
+
+        while True:
+            with self.condition:
+                if not self.chunks:
+                    if self.isClosing:
+                        break
+
+                    self.isScheduled = False
+                    return
+
+                chunk = self.chunks.popleft()
+
+            if self.exception is None:
+                try:
+                    self.file.write(chunk)
+                    self.numBytesWritten+= len(chunk)
+
+                except Exception as e:
+                    self.exception = e
+
+            with self.condition:
+                self.numBufferedBytes-= len(chunk)
+                self.condition.notify_all()
+
+        self._Finish()
+
+    def _Finish(self) -> None:
+        try:
+            # Note: the file is synced once when it is closed instead of after every chunk
+            if self.exception is None:
+                os.fsync(self.file.fileno())
+
+            if self.preallocateBytes > 0 and self.numBytesWritten != self.preallocateBytes:
+                self.file.truncate(self.numBytesWritten)
+
+            self.file.close()
+
+            if self.writePath != self.path:
+                os.replace(self.writePath, self.path)
+
+        except Exception as e:
+            if self.exception is None:
+                self.exception = e
+
+        finally:
+            self.closedEvent.set()
+
+
+class DiskWriter:
+    """ Write-behind stage that moves disk writes off of download threads so slow disks don't stall their sockets.
+        Each open file buffers up to `maxBufferBytes` and is written by one of `numThreads` writer threads at a time.
+    """
+
+    kDefaultNumThreads = 4
+    kPreallocateExtension = ".alloc"
+
+    def __init__(self, maxBufferBytes:int, numThreads:int = kDefaultNumThreads) -> None:
+        self.maxBufferBytes = maxBufferBytes
+
+        self.fileQueue = queue.SimpleQueue()
+        self.writerThreads = [threading.Thread(target=self._WriterThread, name=f"DiskWriter{i}", daemon=True) for i in range(numThreads)]
+        for writerThread in self.writerThreads:
+            writerThread.start()
+
+    def Open(self, path:str, append:bool = False, preallocateBytes:int = 0) -> WriteBehindFile:
+        """ Opens `path` for writing through the writer threads.
+            If `preallocateBytes` is set the file is preallocated with posix_fallocate where it's supported
+        """
+        return WriteBehindFile(self, path, append, preallocateBytes)
+
+    def Close(self) -> None:
+        """Stops the writer threads. Files must be closed first"""
+
+        for _ in self.writerThreads:
+            self.fileQueue.put(None)
+
+        for writerThread in self.writerThreads:
+            writerThread.join()
+
+    def _WriterThread(self) -> None:
+        while True:
+            file = self.fileQueue.get()
+            if file is None:
+                return
+
+            file._Write()
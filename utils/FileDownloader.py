@@ -1,12 +1,19 @@
 import concurrent.futures
+import functools
+import hashlib
 import os
 import re
 import requests
+import sys
 import urllib.parse
 
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import redirect_stdout
+from time import perf_counter
+from utils.DiskWriter import DiskWriter
 from utils.io.ThreadedStdOut import ThreadedStdOut
+from utils.Metrics import Metrics
+from utils.Progress import Progress
 from utils.logging import *
 
 import xml.etree.ElementTree as ET 
@@ -17,47 +24,94 @@ def HumanReadableSize(size:int) -> str:
             return f"{size:.3f} {suffix}"
         size/= 1024 
 
+gSpaceRunRegex = re.compile(" {2,}")
+gContentRangeRegex = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+def makeByteTranslation(symbols:dict[str, str]) -> tuple[bytes, bytes]:
+    """ Returns the (table, deleteBytes) arguments of bytes.translate that replace each ascii symbol of `symbols` with its value.
+        Symbols that map to an empty string are deleted
+    """
+
+    fromBytes = "".join(symbol for symbol, replacement in symbols.items() if replacement).encode("ascii")
+    toBytes   = "".join(replacement for replacement in symbols.values() if replacement).encode("ascii")
+    deleteBytes = "".join(symbol for symbol, replacement in symbols.items() if not replacement).encode("ascii")
+
+    return bytes.maketrans(fromBytes, toBytes), deleteBytes
+
 class DownloadFile(dict):
     pass
 
 class FileDownloader():
     
     kDownloadChunkSize = 1*1024*1024
+    kPartFileExtension = ".part"
+    kValidatorFileExtension = ".etag"
     kDefaultSanitizeSymbol = ""
 
+    # Note: maximum size in bytes of a single file or directory name on common filesystems (NAME_MAX).
+    #       Downloaded files also reserve room for kValidatorFileExtension and for kPartFileExtension followed by
+    #       DiskWriter.kPreallocateExtension, which preallocated part files are written under with --writeBehind
+    kMaxNameBytes = 255
+    kMaxFileNameBytes = kMaxNameBytes - max(len(kPartFileExtension) + len(DiskWriter.kPreallocateExtension), len(kValidatorFileExtension))
+
+    # Note: number of sanitized names cached. Names like user ids and music titles repeat across many posts
+    kSanitizeCacheSize = 1024
+
+    # Note: control characters are removed and illegal path symbols are replaced. 
+    #       Names are encoded as ascii, dropping every other character, so the table is applied with bytes.translate
+    kSanitizeTable, kSanitizeDeleteBytes = makeByteTranslation({
+        **dict.fromkeys(map(chr, range(32)), kDefaultSanitizeSymbol),
+        "\x7f" : kDefaultSanitizeSymbol,
+        "<"    : "{",
+        ">"    : "}",
+        ":"    : ";",
+        "\""   : "'",
+        "/"    : "-",
+        "\\"   : "-",
+        "|"    : ";",
+        "?"    : kDefaultSanitizeSymbol,
+        "*"    : kDefaultSanitizeSymbol,
+    })
+
     @staticmethod
+    @functools.lru_cache(maxsize=kSanitizeCacheSize)
     def SanitizeName(name:str) -> str:
-    
-        illegalSymbols = {
-            "<"  : "{",
-            ">"  : "}",
-            ":"  : ";",
-            "\"" : "'",
-            "/"  : "-",
-            "\\" : "-",
-            "|"  : ";",
-            "?"  : FileDownloader.kDefaultSanitizeSymbol,
-            "*"  : FileDownloader.kDefaultSanitizeSymbol,
-        }
-    
-        sanitizedName = ""
-        for c in name:            
-            charCode = ord(c)
+        sanitizedName = name.encode("ascii", "ignore").translate(FileDownloader.kSanitizeTable, FileDownloader.kSanitizeDeleteBytes).decode("ascii").strip()
 
-            if charCode < 32 or charCode > 126:
-                sanitizedName+= FileDownloader.kDefaultSanitizeSymbol
-            
-            elif c in illegalSymbols:
+        # replace runs of two or more spaces with single space
+        if "  " in sanitizedName:
+            sanitizedName = gSpaceRunRegex.sub(" ", sanitizedName)
+
+        return sanitizedName
 
-                sanitizedName+= illegalSymbols[c]
+    @staticmethod
+    def GetNameBytes(name:str) -> int:
+        """Returns the size of `name` in bytes when encoded for the filesystem"""
+        return len(os.fsencode(name))
 
-            else:
-                sanitizedName+= c
+    @staticmethod
+    def TruncateName(name:str, maxBytes:int) -> str:
+        """Truncates `name` to at most `maxBytes` bytes when encoded for the filesystem without splitting a character"""
 
-        # strip and replace runs of two or more spaces with single space
-        sanitizedName = re.sub("( {2,})", " ", sanitizedName.strip())
+        encodedName = os.fsencode(name)
+        if len(encodedName) <= maxBytes:
+            return name
 
-        return sanitizedName
+        return encodedName[:max(0, maxBytes)].decode(sys.getfilesystemencoding(), "ignore")
+
+    @staticmethod
+    def FitName(name:str, suffix:str = "", maxBytes:int = kMaxNameBytes) -> str:
+        """ Returns `name` + `suffix` truncated to at most `maxBytes` bytes when encoded for the filesystem.
+            If `name` is truncated a short hash of the full name is appended to it so names that share a long prefix don't collide
+        """
+
+        if FileDownloader.GetNameBytes(name) + FileDownloader.GetNameBytes(suffix) <= maxBytes:
+            return name + suffix
+
+        nameHash = "~" + hashlib.sha1(name.encode("utf-8", "surrogatepass")).hexdigest()[:8]
+        truncatedName = FileDownloader.TruncateName(name, maxBytes - FileDownloader.GetNameBytes(nameHash + suffix))
+
+        return truncatedName.rstrip() + nameHash + suffix
 
     @staticmethod
     def ParseXML(xml:ET) -> DownloadFile:
@@ -75,7 +129,10 @@ class FileDownloader():
 
             sanitizedDir  = FileDownloader.SanitizeName(fileDir)
             sanitizedBase = FileDownloader.SanitizeName(fileBase)
-            sanitizedName = os.path.join(sanitizedDir, sanitizedBase) + f"{fileExtension}"
+            sanitizedName = os.path.join(
+                FileDownloader.FitName(sanitizedDir),
+                FileDownloader.FitName(sanitizedBase, fileExtension, FileDownloader.kMaxFileNameBytes)
+            )
 
 
             fileUrlSchemeEndIndex = fileUrl.find("://")
@@ -106,49 +163,221 @@ class FileDownloader():
 
     @staticmethod
     def ParseDir(dir:str) -> set[str]:        
-        if not os.path.exists(dir):
-            return set()
-        
+        """Returns the paths of every file under `dir`. See FileIndex for an index that doesn't crawl the tree every run"""
+
         files = set()
-        for name in os.listdir(dir):
-            fullPath = os.path.join(dir, name)
+        dirStack = [dir]
 
-            if os.path.isdir(fullPath):
-                files = files.union(FileDownloader.ParseDir(fullPath))   
-            else:
-                files.add(fullPath)
+        # Note: symlinked dirs are followed. visitedLinkDirs holds their real paths so a symlink cycle is only walked once
+        visitedLinkDirs:set[str] = set()
+
+        while dirStack:
+            try:
+                with os.scandir(dirStack.pop()) as entries:
+                    for entry in entries:
+                        if not entry.is_dir():
+                            files.add(entry.path)
+                            continue
+
+                        if entry.is_symlink():
+                            realPath = os.path.realpath(entry.path)
+                            if realPath in visitedLinkDirs:
+                                continue
+
+                            visitedLinkDirs.add(realPath)
+
+                        dirStack.append(entry.path)
+
+            except FileNotFoundError:
+                continue
 
         return files
 
     @staticmethod
-    def _DownloadThread(session:requests.Session, savePath:str, url:str) -> None|Exception:
+    def HashFile(filePath:str, hashName:str = "sha256") -> str:
+        """Returns the hex digest of `filePath` hashed in kDownloadChunkSize chunks"""
+
+        hasher = hashlib.new(hashName)
+        with open(filePath, "rb") as file:
+            while chunk := file.read(FileDownloader.kDownloadChunkSize):
+                hasher.update(chunk)
+
+        return hasher.hexdigest()
+
+    @staticmethod
+    def LinkFile(srcPath:str, dstPath:str) -> None:
+        """ Hardlinks `dstPath` to `srcPath`, falling back to a symlink if the filesystem doesn't support hardlinks.
+            An existing file at `dstPath` is replaced.
+        """
+
+        # Note: exist_ok to prevent a race condition with another thread
+        os.makedirs(os.path.dirname(dstPath), exist_ok=True)
+
+        if os.path.lexists(dstPath):
+            if os.path.exists(dstPath) and os.path.samefile(srcPath, dstPath):
+                return
+
+            os.remove(dstPath)
+
+        try:
+            os.link(srcPath, dstPath)
+
+        except OSError as e:
+            log(f"Failed to hardlink '{dstPath}' to '{srcPath}'. Falling back to symlink | Exception: {e}", logLevel=LogLevel.Verbose)
+            os.symlink(os.path.abspath(srcPath), dstPath)
+
+    @staticmethod
+    def _DownloadThread(session:requests.Session, savePath:str, url:str, progress:Progress|None = None, diskWriter:DiskWriter|None = None, metrics:Metrics|None = None) -> None|Exception:
+        """ Downloads `url` to `savePath`. 
+            If `diskWriter` is set chunks are written behind the download instead of by this thread.
+            If `metrics` is set the time spent waiting on the network and on the disk is recorded in the 'networkRead' and 'diskWrite' stages
+        """
+
+        # Note: content is streamed into a '.part' file that is renamed to savePath once complete
+        #       so an interrupted download can be resumed with a range request in a later run.
+        #       The ETag or Last-Modified validator of the remote file is kept in a '.etag' file next to it
+        partPath = savePath + FileDownloader.kPartFileExtension
+        validatorPath = savePath + FileDownloader.kValidatorFileExtension
 
         try:
-            response = session.get(url, stream=True)
+            resumeBytes = os.path.getsize(partPath) if os.path.exists(partPath) else 0
+            validator = FileDownloader._ReadValidator(validatorPath) if resumeBytes > 0 else None
+
+            # Note: a part file without a validator can't be checked against the remote file so it isn't resumed
+            if resumeBytes > 0 and validator is None:
+                log(f"No validator for '{partPath}'. Restarting '{savePath}' from byte 0", logLevel=LogLevel.Verbose)
+                resumeBytes = 0
+
+            # Note: If-Range makes the server reply with the full file instead of the range if the file changed
+            headers = {"Range": f"bytes={resumeBytes}-", "If-Range": validator} if resumeBytes > 0 else None
+            response = session.get(url, stream=True, headers=headers)
+
+            if resumeBytes > 0 and response.status_code == 416:
+                
+                # Note: range is unsatisfiable if the part file is already complete or the remote file changed
+                contentRange = response.headers.get("Content-Range", "")
+                if contentRange == f"bytes */{resumeBytes}":
+                    os.replace(partPath, savePath)
+                    FileDownloader._RemoveValidator(validatorPath)
+                    return None
+
+                log(f"Range request rejected for '{url}'. Restarting '{savePath}' from byte 0 | Content-Range: '{contentRange}'", logLevel=LogLevel.Verbose)
+                response.close()
+                resumeBytes = 0
+                response = session.get(url, stream=True)
+
             response.raise_for_status()
 
-            contentBytes = int(response.headers['Content-Length'])
+            # Note: servers that ignore the range header, or whose file changed since the part file was written, reply
+            #       with '200 OK' and the full content
+            if response.status_code != 206:
+                if resumeBytes > 0:
+                    log(f"Server ignored range request for '{url}'. Restarting '{savePath}' from byte 0", logLevel=LogLevel.Verbose)
+                resumeBytes = 0
+
+            # Note: a range that doesn't start at the end of the part file can't be appended to it
+            elif FileDownloader._GetContentRangeStart(response.headers.get("Content-Range", "")) != resumeBytes:
+                log(f"Range reply doesn't match '{partPath}'. Restarting '{savePath}' from byte 0 | Content-Range: '{response.headers.get('Content-Range')}'", logLevel=LogLevel.Verbose)
+                response.close()
+                resumeBytes = 0
+                response = session.get(url, stream=True)
+                response.raise_for_status()
+
+            if resumeBytes == 0:
+                FileDownloader._WriteValidator(validatorPath, response)
+
+            contentBytes = resumeBytes + int(response.headers['Content-Length'])
+            print(f"--> '{savePath}' [{HumanReadableSize(contentBytes)}]")
+
+            if diskWriter is not None:
+                file = diskWriter.Open(partPath, append=(resumeBytes > 0), preallocateBytes=(contentBytes if resumeBytes == 0 else 0))
+            else:
+                file = open(partPath, "ab" if resumeBytes > 0 else "wb")
 
-            with open(savePath, "wb") as file:
-            
-                totalBytesWritten = 0
+            # Note: networkSeconds is time spent waiting for chunks and diskSeconds is time spent writing them, or waiting
+            #       for room in the write-behind buffer, including closing the file
+            networkSeconds = 0.0
+            diskSeconds = 0.0
+
+            totalBytesWritten = resumeBytes
+            try:
+                readStartTime = perf_counter()
                 for chunk in response.iter_content(chunk_size=FileDownloader.kDownloadChunkSize):
+                    writeStartTime = perf_counter()
+                    networkSeconds+= writeStartTime - readStartTime
                     
                     chunkLen = len(chunk)
                     bytesWritten = file.write(chunk)
 
                     if bytesWritten != chunkLen:
-                        raise Exception(f"Failed to write chunk to '{savePath}'. chunkLen: '{chunkLen}', bytesWritten: '{bytesWritten}'")
+                        raise Exception(f"Failed to write chunk to '{partPath}'. chunkLen: '{chunkLen}', bytesWritten: '{bytesWritten}'")
 
                     totalBytesWritten+= bytesWritten
 
-                    percentComplete = totalBytesWritten / contentBytes 
-                    print(f"--> '{savePath}': {100*percentComplete:.3f}% [{HumanReadableSize(totalBytesWritten)} / {HumanReadableSize(contentBytes)} ]")
-        
+                    if progress is not None:
+                        progress.AddBytes(bytesWritten)
+
+                    readStartTime = perf_counter()
+                    diskSeconds+= readStartTime - writeStartTime
+
+                networkSeconds+= perf_counter() - readStartTime
+
+            finally:
+                closeStartTime = perf_counter()
+                file.close()
+                diskSeconds+= perf_counter() - closeStartTime
+
+                if metrics is not None:
+                    metrics.Record("networkRead", networkSeconds, totalBytesWritten - resumeBytes)
+                    metrics.Record("diskWrite", diskSeconds, totalBytesWritten - resumeBytes)
+
+            if totalBytesWritten != contentBytes:
+                raise Exception(f"Connection closed before download completed. Keeping '{partPath}' to resume later | totalBytesWritten: {totalBytesWritten}, contentBytes: {contentBytes}")
+
+            os.replace(partPath, savePath)
+            FileDownloader._RemoveValidator(validatorPath)
+
         except Exception as e:
             log(f"Failed to download: '{url}' to '{savePath}'. Exception: '{e}' ", logLevel=LogLevel.Verbose)
             return e
 
+    @staticmethod
+    def _GetContentRangeStart(contentRange:str) -> int|None:
+        """Returns the first byte of a 'bytes start-end/size' Content-Range or None if it can't be parsed"""
+
+        contentRangeMatch = gContentRangeRegex.fullmatch(contentRange.strip())
+        return None if contentRangeMatch is None else int(contentRangeMatch.group(1))
+
+    @staticmethod
+    def _ReadValidator(validatorPath:str) -> str|None:
+        try:
+            with open(validatorPath, "r", encoding="utf-8") as file:
+                return file.read().strip() or None
+
+        except OSError:
+            return None
+
+    @staticmethod
+    def _WriteValidator(validatorPath:str, response:requests.Response) -> None:
+        """Stores the validator of a file whose download starts at byte 0 so it can be resumed with If-Range"""
+
+        # Note: weak ETags can't be used with If-Range so Last-Modified is used instead
+        etag = response.headers.get("ETag", "")
+        validator = etag if (etag and not etag.startswith("W/")) else response.headers.get("Last-Modified", "")
+
+        if validator:
+            with open(validatorPath, "w", encoding="utf-8") as file:
+                file.write(validator)
+        else:
+            FileDownloader._RemoveValidator(validatorPath)
+
+    @staticmethod
+    def _RemoveValidator(validatorPath:str) -> None:
+        try:
+            os.remove(validatorPath)
+        except FileNotFoundError:
+            pass
+
 
     @staticmethod
     def Download(downloadFile: DownloadFile, dir:str = ".", numThreads:int=1, session:requests.Session = None) -> int:
@@ -160,7 +389,7 @@ class FileDownloader():
 
         numDownloads = len(downloadFile)
         stdOutHeader = f"--- Downloading {numDownloads} files to '{dir}' (this may take some time) ---"
-        with redirect_stdout(ThreadedStdOut(header=stdOutHeader)):
+        with ThreadedStdOut(header=stdOutHeader) as threadedStdOut, redirect_stdout(threadedStdOut):
             
             for name, url in downloadFile.items():
                 savePath = os.path.join(dir, name)
@@ -0,0 +1,279 @@
+import os
+import sqlite3
+import threading
+
+from time import perf_counter, time_ns
+from utils.logging import *
+
+class FileIndex:
+    """ Persistent index of the files under `rootDir` with their size and mtime.
+        Refresh only lists directories whose mtime changed since they were indexed, so an unchanged tree costs one stat
+        per directory instead of a crawl. Hidden directories (Ex: .mediaStore, .pageCache) aren't indexed.
+        Only files recorded complete with AddFile are reported complete, and only while they keep their indexed size and mtime.
+        Files found on disk by Refresh (Ex: truncated files of older runs) have to be verified some other way.
+    """
+
+    kSchema = """
+        CREATE TABLE IF NOT EXISTS dirs (
+            path        TEXT    PRIMARY KEY,
+            mtimeNs     INTEGER NOT NULL
+        );
+
+        CREATE TABLE IF NOT EXISTS files (
+            dir         TEXT    NOT NULL,
+            name        TEXT    NOT NULL,
+            numBytes    INTEGER NOT NULL,
+            mtimeNs     INTEGER NOT NULL,
+            isComplete  INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dir, name)
+        );
+    """
+
+    # Note: directories modified less than kRacyMarginNs before they were listed may change again within the same mtime tick,
+    #       so they are indexed without an mtime and listed again by the next refresh
+    kRacyMarginNs = 2*1000*1000*1000
+    kUnknownMtime = -1
+
+    def __init__(self, rootDir:str, filePath:str) -> None:
+        self.rootDir = rootDir
+        self.filePath = filePath
+        self.lock = threading.Lock()
+
+        # Note: dirs are keyed by their path relative to rootDir, with "" for rootDir itself.
+        #       dirFiles is in format dir -> {name: (numBytes, mtimeNs, isComplete)} and dirChildren is in format dir -> {subdir names}
+        self.dirMtimes:dict[str, int] = {}
+        self.dirFiles:dict[str, dict[str, tuple[int, int, bool]]] = {}
+        self.dirChildren:dict[str, set[str]] = {}
+
+        # Note: dirtyDirs are dirs that changed since the index was last saved and writtenDirs are dirs files were added to
+        self.dirtyDirs:set[str] = set()
+        self.writtenDirs:set[str] = set()
+
+        os.makedirs(rootDir, exist_ok=True)
+
+        # Note: the connection is only used by Load and Save which hold self.lock
+        self.connection = sqlite3.connect(filePath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(FileIndex.kSchema)
+
+        # Note: indexes written before isComplete existed are upgraded with every file unverified
+        fileColumns = {row[1] for row in self.connection.execute("PRAGMA table_info(files)")}
+        if "isComplete" not in fileColumns:
+            self.connection.execute("ALTER TABLE files ADD COLUMN isComplete INTEGER NOT NULL DEFAULT 0")
+
+        self.connection.commit()
+
+        self.Load()
+
+    def Load(self) -> None:
+        with self.lock:
+            self.dirMtimes = dict(self.connection.execute("SELECT path, mtimeNs FROM dirs"))
+
+            self.dirFiles = {dir: {} for dir in self.dirMtimes}
+            self.dirChildren = {dir: set() for dir in self.dirMtimes}
+            for dir in self.dirMtimes:
+                if dir:
+                    parentDir, name = os.path.split(dir)
+                    self.dirChildren.setdefault(parentDir, set()).add(name)
+
+            for dir, name, numBytes, mtimeNs, isComplete in self.connection.execute("SELECT dir, name, numBytes, mtimeNs, isComplete FROM files"):
+                dirFiles = self.dirFiles.get(dir)
+                if dirFiles is not None:
+                    dirFiles[name] = (numBytes, mtimeNs, bool(isComplete))
+
+            self.dirtyDirs.clear()
+
+        log(f"Loaded file index: '{self.filePath}' | {self}", logLevel=LogLevel.Verbose)
+
+    def Refresh(self) -> None:
+        """Brings the index up to date with the files on disk, listing only dirs that changed since they were indexed"""
+
+        startTime = perf_counter()
+        numScannedDirs = 0
+
+        with self.lock:
+            dirStack = [""]
+            while dirStack:
+                dir = dirStack.pop()
+
+                try:
+                    mtimeNs = os.stat(self.GetPath(dir)).st_mtime_ns
+                except FileNotFoundError:
+                    self._RemoveDir(dir)
+                    continue
+
+                if self.dirMtimes.get(dir) != mtimeNs:
+                    self._ScanDir(dir, mtimeNs)
+                    numScannedDirs+= 1
+
+                dirStack.extend(os.path.join(dir, name) for name in self.dirChildren.get(dir, ()))
+
+        log(f"Refreshed file index in {perf_counter() - startTime:.3f}s | listed {numScannedDirs}/{len(self.dirMtimes)} dirs | {self}")
+
+    def IsFileComplete(self, savePath:str) -> bool:
+        """Returns True if `savePath` was recorded complete with AddFile and still has its indexed size and mtime"""
+
+        dir, name = os.path.split(self.GetRelativePath(savePath))
+        with self.lock:
+            dirFiles = self.dirFiles.get(dir)
+            fileInfo = None if dirFiles is None else dirFiles.get(name)
+
+        if fileInfo is None:
+            return False
+
+        numBytes, mtimeNs, isComplete = fileInfo
+        if not isComplete:
+            return False
+
+        try:
+            stat = os.stat(savePath)
+        except OSError:
+            return False
+
+        return (stat.st_size, stat.st_mtime_ns) == (numBytes, mtimeNs)
+
+    def AddFile(self, savePath:str) -> None:
+        """Indexes `savePath` as complete after it was written or verified. Its dir is listed again when the index is saved"""
+
+        stat = os.stat(savePath)
+        dir, name = os.path.split(self.GetRelativePath(savePath))
+
+        with self.lock:
+            self._AddDir(dir)
+            self.dirFiles[dir][name] = (stat.st_size, stat.st_mtime_ns, True)
+            self.dirtyDirs.add(dir)
+            self.writtenDirs.add(dir)
+
+    def Save(self) -> None:
+        """Writes the dirs that changed since the last save to the index file"""
+
+        with self.lock:
+
+            # Note: dirs we added files to are listed again so their mtime covers every file written to them
+            for dir in self.writtenDirs:
+                if dir in self.dirMtimes:
+                    try:
+                        self._ScanDir(dir, os.stat(self.GetPath(dir)).st_mtime_ns)
+                    except FileNotFoundError:
+                        self._RemoveDir(dir)
+
+            self.writtenDirs.clear()
+
+            with self.connection:
+                for dir in self.dirtyDirs:
+                    self.connection.execute("DELETE FROM dirs WHERE path = ?", (dir,))
+                    self.connection.execute("DELETE FROM files WHERE dir = ?", (dir,))
+
+                    mtimeNs = self.dirMtimes.get(dir)
+                    if mtimeNs is None:
+                        continue
+
+                    self.connection.execute("INSERT INTO dirs (path, mtimeNs) VALUES (?, ?)", (dir, mtimeNs))
+                    self.connection.executemany(
+                        "INSERT INTO files (dir, name, numBytes, mtimeNs, isComplete) VALUES (?, ?, ?, ?, ?)",
+                        ((dir, name, numBytes, fileMtimeNs, isComplete) for name, (numBytes, fileMtimeNs, isComplete) in self.dirFiles[dir].items())
+                    )
+
+            numSavedDirs = len(self.dirtyDirs)
+            self.dirtyDirs.clear()
+
+        log(f"Saved {numSavedDirs} changed dirs to file index: '{self.filePath}'", logLevel=LogLevel.Verbose)
+
+    def Close(self) -> None:
+        self.Save()
+
+        with self.lock:
+            self.connection.close()
+
+    def GetPath(self, dir:str) -> str:
+        return os.path.join(self.rootDir, dir) if dir else self.rootDir
+
+    def GetRelativePath(self, path:str) -> str:
+        # Note: paths built from rootDir share its prefix so the common case doesn't need os.path.relpath
+        if path.startswith(self.rootDir) and path[len(self.rootDir):len(self.rootDir)+1] in ("/", os.sep):
+            return os.path.normpath(path[len(self.rootDir)+1:])
+
+        return os.path.relpath(path, self.rootDir)
+
+    def __str__(self) -> str:
+        with self.lock:
+            numFiles = sum(len(dirFiles) for dirFiles in self.dirFiles.values())
+            numCompleteFiles = sum(fileInfo[2] for dirFiles in self.dirFiles.values() for fileInfo in dirFiles.values())
+            return f"FileIndex [dirs: {len(self.dirMtimes)} | files: {numFiles} | complete: {numCompleteFiles}]"
+
+    def _AddDir(self, dir:str) -> None:
+        """Adds `dir` and its parents to the index without an mtime so they are listed by the next refresh"""
+
+        while dir not in self.dirMtimes:
+            self.dirMtimes[dir] = FileIndex.kUnknownMtime
+            self.dirFiles[dir] = {}
+            self.dirChildren.setdefault(dir, set())
+            self.dirtyDirs.add(dir)
+
+            if not dir:
+                return
+
+            parentDir, name = os.path.split(dir)
+            self.dirChildren.setdefault(parentDir, set()).add(name)
+            dir = parentDir
+
+    def _RemoveDir(self, dir:str) -> None:
+        """Removes `dir` and its subdirs from the index"""
+
+        if dir in self.dirMtimes:
+            self.dirtyDirs.add(dir)
+            del self.dirMtimes[dir]
+            del self.dirFiles[dir]
+
+        for name in self.dirChildren.pop(dir, ()):
+            self._RemoveDir(os.path.join(dir, name))
+
+        if dir:
+            parentDir, name = os.path.split(dir)
+            parentChildren = self.dirChildren.get(parentDir)
+            if parentChildren is not None:
+                parentChildren.discard(name)
+
+    def _ScanDir(self, dir:str, mtimeNs:int) -> None:
+        """Lists `dir`, which was modified at `mtimeNs`, and replaces its indexed files and subdirs"""
+
+        files:dict[str, tuple[int, int, bool]] = {}
+        children:set[str] = set()
+
+        # Note: files stay complete while they keep the size and mtime they were recorded complete with
+        oldFiles = self.dirFiles.get(dir, {})
+
+        with os.scandir(self.GetPath(dir)) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            children.add(entry.name)
+
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        oldFileInfo = oldFiles.get(entry.name)
+                        isComplete = oldFileInfo is not None and oldFileInfo == (stat.st_size, stat.st_mtime_ns, True)
+                        files[entry.name] = (stat.st_size, stat.st_mtime_ns, isComplete)
+
+                # Note: entries can be removed while the dir is listed
+                except FileNotFoundError:
+                    continue
+
+        for name in self.dirChildren.get(dir, set()) - children:
+            self._RemoveDir(os.path.join(dir, name))
+
+        for name in children:
+            childDir = os.path.join(dir, name)
+            if childDir not in self.dirMtimes:
+                self.dirMtimes[childDir] = FileIndex.kUnknownMtime
+                self.dirFiles[childDir] = {}
+                self.dirtyDirs.add(childDir)
+
+        isRacy = time_ns() - mtimeNs < FileIndex.kRacyMarginNs
+
+        self.dirMtimes[dir] = FileIndex.kUnknownMtime if isRacy else mtimeNs
+        self.dirFiles[dir] = files
+        self.dirChildren[dir] = children
+        self.dirtyDirs.add(dir)
@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import threading
+
+from time import time
+from utils.logging import *
+
+class JobLedger:
+    """ Durable sqlite ledger of post results and completed files.
+        Lets a restarted run skip posts and files that finished in a previous run.
+    """
+
+    kSchema = """
+        CREATE TABLE IF NOT EXISTS posts (
+            postId      TEXT    NOT NULL,
+            downloadDir TEXT    NOT NULL,
+            url         TEXT    NOT NULL,
+            resultType  INTEGER NOT NULL,
+            updateTime  REAL    NOT NULL,
+            PRIMARY KEY (postId, downloadDir)
+        );
+
+        CREATE TABLE IF NOT EXISTS files (
+            savePath    TEXT    PRIMARY KEY,
+            postId      TEXT    NOT NULL,
+            url         TEXT    NOT NULL,
+            numBytes    INTEGER NOT NULL,
+            updateTime  REAL    NOT NULL
+        );
+
+        CREATE INDEX IF NOT EXISTS filesPostIdIndex ON files(postId);
+    """
+
+    def __init__(self, filePath:str) -> None:
+        self.filePath = filePath
+        self.lock = threading.Lock()
+
+        fileDir = os.path.dirname(filePath)
+        if fileDir:
+            os.makedirs(fileDir, exist_ok=True)
+
+        # Note: the connection is shared between worker threads and serialized by self.lock
+        self.connection = sqlite3.connect(filePath, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(JobLedger.kSchema)
+        self.connection.commit()
+
+        log(f"Opened job ledger: '{filePath}'", logLevel=LogLevel.Verbose)
+
+    def Close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+    def GetResults(self, downloadDir:str) -> dict[str, int]:
+        """Returns a dict of postId to the last recorded resultType for posts downloaded to `downloadDir`"""
+        with self.lock:
+            rows = self.connection.execute("SELECT postId, resultType FROM posts WHERE downloadDir = ?", (downloadDir,)).fetchall()
+
+        return {postId: resultType for postId, resultType in rows}
+
+    def SetResult(self, postId:str, downloadDir:str, url:str, resultType:int) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO posts (postId, downloadDir, url, resultType, updateTime) VALUES (?, ?, ?, ?, ?)",
+                (postId, downloadDir, url, int(resultType), time())
+            )
+            self.connection.commit()
+
+    def IsFileComplete(self, savePath:str) -> bool:
+        """Returns True if `savePath` was completed in a previous run and still exists on disk with the recorded size"""
+        with self.lock:
+            row = self.connection.execute("SELECT numBytes FROM files WHERE savePath = ?", (savePath,)).fetchone()
+
+        if row is None:
+            return False
+
+        try:
+            return os.path.getsize(savePath) == row[0]
+        except OSError:
+            return False
+
+    def SetFileComplete(self, postId:str, url:str, savePath:str) -> None:
+        numBytes = os.path.getsize(savePath)
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files (savePath, postId, url, numBytes, updateTime) VALUES (?, ?, ?, ?, ?)",
+                (savePath, postId, url, numBytes, time())
+            )
+            self.connection.commit()
@@ -0,0 +1,185 @@
+import json
+import re
+
+from io import TextIOBase
+from typing import Any, Iterator
+from utils.parse import ParseException
+
+gWhitespaceRegex     = re.compile(r"[ \t\n\r]*")
+gStringBodyRegex     = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+gContainerTokenRegex = re.compile(r'["\[\]{}]')
+gScalarRegex         = re.compile(r"[^,\]}\s]*")
+
+class JsonStream:
+    """ Incrementally scans a json file in fixed size chunks and decodes only the arrays it is asked for.
+        All other values are skipped without being decoded so memory stays flat regardless of the file size.
+    """
+
+    kDefaultChunkSize = 1*1024*1024
+
+    def __init__(self, file:TextIOBase, chunkSize:int = kDefaultChunkSize) -> None:
+        self.file = file
+        self.chunkSize = chunkSize
+
+        self.buffer = ""
+        self.pos = 0
+        self.isEof = False
+        self.decoder = json.JSONDecoder()
+
+    def IterArrays(self, arrayPaths:list[tuple[str, ...]]) -> Iterator[tuple[tuple[str, ...], Any]]:
+        """ Yields (arrayPath, element) for every element of the arrays found at `arrayPaths` in file order.
+            Example: IterArrays([("Activity", "Like List", "ItemFavoriteList")])
+        """
+
+        arrayPaths = set(tuple(path) for path in arrayPaths)
+        prefixPaths = {path[:i] for path in arrayPaths for i in range(len(path))}
+
+        yield from self._Walk((), arrayPaths, prefixPaths)
+
+    def _Walk(self, path:tuple[str, ...], arrayPaths:set[tuple[str, ...]], prefixPaths:set[tuple[str, ...]]) -> Iterator[tuple[tuple[str, ...], Any]]:
+
+        if path in arrayPaths and self._Peek() == "[":
+            yield from self._IterArray(path)
+            return
+
+        if path not in prefixPaths or self._Peek() != "{":
+            self._SkipValue()
+            return
+
+        self._Expect("{")
+        if self._Peek() == "}":
+            self.pos+= 1
+            return
+
+        while True:
+            key = self._ReadString()
+            self._Expect(":")
+
+            yield from self._Walk(path + (key,), arrayPaths, prefixPaths)
+
+            if self._Expect(",}") == "}":
+                return
+
+    def _IterArray(self, path:tuple[str, ...]) -> Iterator[tuple[tuple[str, ...], Any]]:
+
+        self._Expect("[")
+        if self._Peek() == "]":
+            self.pos+= 1
+            return
+
+        while True:
+            yield path, self._DecodeValue()
+
+            if self._Expect(",]") == "]":
+                return
+
+    def _Fill(self) -> bool:
+        """Appends the next chunk of the file to buffer and drops the consumed content. Returns False at the end of the file"""
+
+        if self.isEof:
+            return False
+
+        chunk = self.file.read(self.chunkSize)
+        if not chunk:
+            self.isEof = True
+            return False
+
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _Peek(self) -> str:
+        """Skips whitespace and returns the next character without consuming it"""
+
+        while True:
+            self.pos = gWhitespaceRegex.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+
+            if not self._Fill():
+                raise ParseException("Unexpected end of json stream")
+
+    def _Expect(self, chars:str) -> str:
+        c = self._Peek()
+        if c not in chars:
+            raise ParseException(f"Expected one of '{chars}' in json stream, got '{c}' | context: '{self.buffer[self.pos:self.pos+64]}'")
+
+        self.pos+= 1
+        return c
+
+    def _MatchString(self) -> re.Match:
+        """Returns the match of the string starting at pos, reading more of the file until its closing quote is buffered"""
+
+        if self._Peek() != '"':
+            raise ParseException(f"Expected string in json stream | context: '{self.buffer[self.pos:self.pos+64]}'")
+
+        while True:
+            match = gStringBodyRegex.match(self.buffer, self.pos + 1)
+            if match is not None:
+                return match
+
+            if not self._Fill():
+                raise ParseException("Unexpected end of json stream while reading string")
+
+    def _ReadString(self) -> str:
+        match = self._MatchString()
+        result = json.loads(self.buffer[self.pos:match.end()])
+
+        self.pos = match.end()
+        return result
+
+    def _DecodeValue(self) -> Any:
+        self._Peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+
+                # Note: a scalar that ends with the buffer may be truncated by the chunk boundary (Ex: '12|34')
+                if end < len(self.buffer) or self.isEof:
+                    self.pos = end
+                    return value
+
+            except json.JSONDecodeError as e:
+                if self.isEof:
+                    raise ParseException(f"Failed to decode json stream value | exception: {e}")
+
+            self._Fill()
+
+    def _SkipValue(self) -> None:
+        c = self._Peek()
+
+        if c == '"':
+            self.pos = self._MatchString().end()
+            return
+
+        if c in "[{":
+            depth = 0
+            while True:
+                match = gContainerTokenRegex.search(self.buffer, self.pos)
+                if match is None:
+
+                    # Note: the rest of the buffer has no structural tokens so it can be dropped
+                    self.pos = len(self.buffer)
+                    if not self._Fill():
+                        raise ParseException("Unexpected end of json stream while skipping value")
+
+                    continue
+
+                token = match.group()
+                if token == '"':
+                    self.pos = match.start()
+                    self.pos = self._MatchString().end()
+                    continue
+
+                self.pos = match.end()
+                depth+= 1 if token in "[{" else -1
+                if depth == 0:
+                    return
+
+        # skip number, true, false or null
+        while True:
+            match = gScalarRegex.match(self.buffer, self.pos)
+            if match.end() < len(self.buffer) or not self._Fill():
+                self.pos = match.end()
+                return
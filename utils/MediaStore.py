@@ -0,0 +1,108 @@
+import hashlib
+import os
+import requests
+import threading
+
+from utils.DiskWriter import DiskWriter
+from utils.FileDownloader import FileDownloader
+from utils.Metrics import Metrics
+from utils.Progress import Progress
+from utils.logging import *
+
+class MediaStore:
+    """ Content addressed store for media shared between posts, such as music and music covers.
+        Each asset is downloaded once per key, verified by its sha256 digest and hardlinked into post dirs.
+    """
+
+    kDigestExtension = ".sha256"
+
+    def __init__(self, storeDir:str) -> None:
+        self.storeDir = storeDir
+
+        self.lock = threading.Lock()
+        self.keyLocks:dict[str, threading.Lock] = {}
+        self.verifiedKeys:set[str] = set()
+
+        self.numHits   = 0
+        self.numMisses = 0
+
+        os.makedirs(storeDir, exist_ok=True)
+
+    def GetPath(self, key:str) -> str:
+        # Note: keys are hashed so arbitrary ids and urls map to valid, evenly distributed file names
+        keyHash = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return f"{self.storeDir}/{keyHash[:2]}/{keyHash}"
+
+    def Fetch(self, session:requests.Session, key:str, url:str, savePath:str, progress:Progress|None = None, diskWriter:DiskWriter|None = None, metrics:Metrics|None = None) -> None|Exception:
+        """ Links the asset stored under `key` to `savePath`, downloading it from `url` first if it isn't in the store. 
+            Returns None on success or the exception that occurred.
+        """
+
+        storePath = self.GetPath(key)
+
+        try:
+            with self._GetKeyLock(key):
+
+                isStored = key in self.verifiedKeys or self._IsValid(storePath)
+                self._CountFetch(isStored)
+
+                if not isStored:
+                    os.makedirs(os.path.dirname(storePath), exist_ok=True)
+
+                    downloadException = FileDownloader._DownloadThread(session=session, savePath=storePath, url=url, progress=progress, diskWriter=diskWriter, metrics=metrics)
+                    if downloadException is not None:
+                        return downloadException
+
+                    self._WriteDigest(storePath)
+                    log(f"Stored '{key}' from '{url}' in '{storePath}'", logLevel=LogLevel.Verbose)
+
+                self.verifiedKeys.add(key)
+
+            FileDownloader.LinkFile(storePath, savePath)
+
+        except Exception as e:
+            log(f"Failed to fetch '{key}' from media store to '{savePath}'. Exception: '{e}'", logLevel=LogLevel.Verbose)
+            return e
+
+        return None
+
+    def _CountFetch(self, isHit:bool) -> None:
+        with self.lock:
+            if isHit:
+                self.numHits+= 1
+            else:
+                self.numMisses+= 1
+
+    def _GetKeyLock(self, key:str) -> threading.Lock:
+        with self.lock:
+            keyLock = self.keyLocks.get(key)
+            if keyLock is None:
+                keyLock = self.keyLocks[key] = threading.Lock()
+
+            return keyLock
+
+    def _IsValid(self, storePath:str) -> bool:
+        """Returns True if `storePath` exists and matches the digest recorded when it was stored"""
+
+        digestPath = storePath + MediaStore.kDigestExtension
+        if not os.path.exists(storePath) or not os.path.exists(digestPath):
+            return False
+
+        with open(digestPath, "r") as file:
+            digest = file.read().strip()
+
+        if FileDownloader.HashFile(storePath) != digest:
+            warn(f"Digest mismatch for stored media '{storePath}'. Downloading it again")
+            return False
+
+        return True
+
+    def _WriteDigest(self, storePath:str) -> None:
+        digestPath = storePath + MediaStore.kDigestExtension
+
+        # Note: written to a temporary file first so a crash never leaves a truncated digest behind
+        tmpPath = digestPath + FileDownloader.kPartFileExtension
+        with open(tmpPath, "w") as file:
+            file.write(FileDownloader.HashFile(storePath))
+
+        os.replace(tmpPath, digestPath)
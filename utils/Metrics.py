@@ -0,0 +1,152 @@
+import json
+import math
+import os
+import threading
+
+from time import monotonic
+from utils.logging import *
+from utils.parse import parseHumanReadableSize
+
+class StageMetrics:
+    """ Duration histogram and byte count of a single stage.
+        Durations are counted in log scale buckets that grow by kBucketGrowth so percentiles are accurate to within ~5%
+        and memory stays constant regardless of the number of samples.
+    """
+
+    kMinSeconds = 1e-6
+    kBucketGrowth = 1.05
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.totalSeconds = 0.0
+        self.maxSeconds = 0.0
+        self.numBytes = 0
+
+        # Note: buckets is in format bucketIndex -> count where bucketIndex covers durations up to kMinSeconds * kBucketGrowth**bucketIndex
+        self.buckets:dict[int, int] = {}
+
+    def Add(self, seconds:float, numBytes:int) -> None:
+        bucketIndex = 0 if seconds <= StageMetrics.kMinSeconds else math.ceil(math.log(seconds / StageMetrics.kMinSeconds, StageMetrics.kBucketGrowth))
+
+        self.count+= 1
+        self.totalSeconds+= seconds
+        self.maxSeconds = max(self.maxSeconds, seconds)
+        self.numBytes+= numBytes
+        self.buckets[bucketIndex] = self.buckets.get(bucketIndex, 0) + 1
+
+    def GetPercentile(self, percentile:float) -> float:
+        """Returns the upper bound of the bucket containing `percentile` (0-1) of the durations"""
+
+        targetCount = percentile * self.count
+        numCounted = 0
+        for bucketIndex in sorted(self.buckets):
+            numCounted+= self.buckets[bucketIndex]
+            if numCounted >= targetCount:
+                return min(self.maxSeconds, StageMetrics.kMinSeconds * StageMetrics.kBucketGrowth**bucketIndex)
+
+        return self.maxSeconds
+
+    def GetReport(self) -> dict[str, float]:
+        return {
+            "count"         : self.count,
+            "totalSeconds"  : self.totalSeconds,
+            "meanSeconds"   : self.totalSeconds / self.count if self.count > 0 else 0,
+            "p50Seconds"    : self.GetPercentile(0.50),
+            "p95Seconds"    : self.GetPercentile(0.95),
+            "p99Seconds"    : self.GetPercentile(0.99),
+            "maxSeconds"    : self.maxSeconds,
+            "numBytes"      : self.numBytes,
+            "bytesPerSecond": self.numBytes / self.totalSeconds if self.totalSeconds > 0 else 0,
+        }
+
+
+class Metrics:
+    """ Per-stage timing and byte counters shared between worker threads.
+        If `metricsFilePath` is set a text summary of the stages is rewritten every `metricsInterval` seconds during the run.
+    """
+
+    def __init__(self, metricsFilePath:str = "", metricsInterval:float = 10) -> None:
+        self.metricsFilePath = metricsFilePath
+        self.metricsInterval = metricsInterval
+
+        self.lock = threading.Lock()
+        self.stages:dict[str, StageMetrics] = {}
+        self.startTime = monotonic()
+
+        self.stopEvent = threading.Event()
+        self.writerThread = None
+        if metricsFilePath:
+            self.writerThread = threading.Thread(target=self._WriterThread, name="MetricsWriter", daemon=True)
+            self.writerThread.start()
+
+    def Record(self, stage:str, seconds:float, numBytes:int = 0) -> None:
+        with self.lock:
+            stageMetrics = self.stages.get(stage)
+            if stageMetrics is None:
+                stageMetrics = self.stages[stage] = StageMetrics()
+
+            stageMetrics.Add(seconds, numBytes)
+
+    def GetReport(self) -> dict:
+        with self.lock:
+            return {
+                "durationSeconds": monotonic() - self.startTime,
+                "stages": {stage: stageMetrics.GetReport() for stage, stageMetrics in self.stages.items()},
+            }
+
+    def SaveReport(self, filePath:str, **reportFields) -> None:
+        """Writes the report, with `reportFields` added to it, to `filePath` as json"""
+
+        report = self.GetReport()
+        report.update(reportFields)
+
+        with open(filePath, "w") as file:
+            json.dump(report, file, indent=4)
+
+        log(f"Saved run report: '{filePath}'", logLevel=LogLevel.Verbose)
+
+    def Close(self) -> None:
+        """Stops the metrics writer after writing the final metrics"""
+
+        if self.writerThread is None or self.stopEvent.is_set():
+            return
+
+        self.stopEvent.set()
+        self.writerThread.join()
+
+    def __str__(self) -> str:
+        report = self.GetReport()
+
+        result = f"Elapsed: {report['durationSeconds']:.3f}s\n"
+        result+= f"{'Stage':<16} {'Count':>8} {'Total':>10} {'Mean':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'Max':>10} {'Bytes':>14} {'Rate':>16}\n"
+
+        for stage, stageReport in sorted(report["stages"].items()):
+            result+= f"{stage:<16} {stageReport['count']:>8}"
+            for key in ["totalSeconds", "meanSeconds", "p50Seconds", "p95Seconds", "p99Seconds", "maxSeconds"]:
+                result+= f" {stageReport[key]:>9.3f}s"
+
+            result+= f" {parseHumanReadableSize(stageReport['numBytes']):>14} {parseHumanReadableSize(stageReport['bytesPerSecond']) + '/s':>16}\n"
+
+        return result
+
+    def _WriterThread(self) -> None:
+        while not self.stopEvent.wait(self.metricsInterval):
+            self._WriteMetricsFile()
+
+        self._WriteMetricsFile()
+
+    def _WriteMetricsFile(self) -> None:
+        try:
+            metricsDir = os.path.dirname(self.metricsFilePath)
+            if metricsDir:
+                os.makedirs(metricsDir, exist_ok=True)
+
+            # Note: written to a temporary file first so readers never see a partial summary
+            tmpPath = self.metricsFilePath + ".tmp"
+            with open(tmpPath, "w") as file:
+                file.write(str(self))
+
+            os.replace(tmpPath, self.metricsFilePath)
+
+        except Exception as e:
+            error(f"Failed to write metrics file: '{self.metricsFilePath}' | Exception: {e}")
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import re
+import threading
+
+from time import time
+from utils.FileDownloader import FileDownloader
+from utils.logging import *
+
+# Note: signed tiktok cdn urls carry their expiry as a unix timestamp in either an 'x-expires' or 'expire' query param.
+#       The params may be preceded by an escaped '&' (Ex: '&x-expires=') so the match isn't anchored
+gUrlExpireRegex = re.compile(r"(?:x-expires|expire)=(\d+)")
+
+# Note: post ids are normally numeric but fall back to the full url, so anything else is hashed before it's used as a file name
+gSafePostIdRegex = re.compile(r"[0-9A-Za-z_-]{1,128}")
+
+class PageCache:
+    """ On-disk cache of the rehydration script of post pages keyed by post id.
+        Entries expire after `ttl` seconds or shortly before the earliest signed media url in the script expires,
+        whichever comes first, so cached posts can go straight to downloading their media.
+    """
+
+    kExpireMargin = 5*60
+
+    def __init__(self, cacheDir:str, ttl:float) -> None:
+        self.cacheDir = cacheDir
+        self.ttl = ttl
+
+        self.lock = threading.Lock()
+        self.numHits   = 0
+        self.numMisses = 0
+
+        os.makedirs(cacheDir, exist_ok=True)
+
+    def GetPath(self, postId:str) -> str:
+        if gSafePostIdRegex.fullmatch(postId) is None:
+            postId = hashlib.sha1(postId.encode("utf-8", "surrogatepass")).hexdigest()
+
+        return f"{self.cacheDir}/{postId[-2:]}/{postId}.json"
+
+    def Get(self, postId:str) -> str|None:
+        """Returns the cached script text of `postId` or None if it isn't cached or expired"""
+
+        cachePath = self.GetPath(postId)
+
+        try:
+            with open(cachePath, "r", encoding="utf-8") as file:
+                expireTime = float(file.readline())
+
+                if expireTime > time():
+                    self._CountGet(isHit=True)
+                    return file.read()
+
+            log(f"Cached page of post {postId} expired", logLevel=LogLevel.Verbose)
+            self.Remove(postId)
+
+        except (OSError, ValueError):
+            pass
+
+        self._CountGet(isHit=False)
+        return None
+
+    def Put(self, postId:str, scriptText:str) -> None:
+        expireTime = self.GetExpireTime(scriptText)
+        if expireTime <= time():
+            return
+
+        cachePath = self.GetPath(postId)
+        os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+
+        # Note: written to a temporary file first so concurrent readers never see a partial entry
+        tmpPath = cachePath + FileDownloader.kPartFileExtension
+        with open(tmpPath, "w", encoding="utf-8") as file:
+            file.write(f"{expireTime}\n")
+            file.write(scriptText)
+
+        os.replace(tmpPath, cachePath)
+
+    def Remove(self, postId:str) -> None:
+        try:
+            os.remove(self.GetPath(postId))
+
+        except FileNotFoundError:
+            pass
+
+        except OSError as e:
+            log(f"Failed to remove cached page of post {postId} | Exception: {e}", logLevel=LogLevel.Verbose)
+
+    def GetExpireTime(self, scriptText:str) -> float:
+        """Returns the time `scriptText` stops being valid: after ttl or kExpireMargin seconds before its first signed url expires"""
+
+        expireTime = time() + self.ttl
+
+        urlExpireTimes = [int(match) for match in gUrlExpireRegex.findall(scriptText)]
+        if urlExpireTimes:
+            expireTime = min(expireTime, min(urlExpireTimes) - PageCache.kExpireMargin)
+
+        return expireTime
+
+    def _CountGet(self, isHit:bool) -> None:
+        with self.lock:
+            if isHit:
+                self.numHits+= 1
+            else:
+                self.numMisses+= 1
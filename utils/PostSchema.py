@@ -0,0 +1,275 @@
+import html
+
+from dataclasses import dataclass
+from typing import Any, Callable, Type, TypeVar, get_args, get_origin
+
+from utils.parse import *
+
+@dataclass(frozen=True)
+class SchemaField:
+    """ A field read from a json dict by a compiled schema.
+        `path` is a '.' separated list of keys relative to the root dict. Keys can be suffixed with:
+            '?'  - the field is set to `default`, or a new `defaultFactory()`, if the key is missing instead of raising a ParseException
+            '[]' - the value is a list and the rest of the path is read from each of its elements
+        Ex: 'imagePost?.images[].imageURL.urlList'
+    """
+
+    name    : str
+    path    : str
+    ParseT  : Any = Any
+    default : Any = None
+    isHtml  : bool = False
+    defaultFactory : Callable[[], Any]|None = None
+
+
+kPostSchema = [
+    SchemaField("id",             "id",                                   str, isHtml=True),
+    SchemaField("timestamp",      "createTime",                           int),
+    SchemaField("comments",       "comments",                             list[str]),
+    SchemaField("keywords",       "suggestedWords?",                      defaultFactory=list),
+    SchemaField("location",       "locationCreated",                      isHtml=True),
+    SchemaField("description",    "desc",                                 isHtml=True),
+
+    SchemaField("userId",         "author.uniqueId",                      isHtml=True),
+    SchemaField("userNickname",   "author.nickname",                      isHtml=True),
+    SchemaField("userSignature",  "author.signature",                     isHtml=True),
+
+    SchemaField("musicUrl",       "music.playUrl",                        isHtml=True),
+    SchemaField("musicCoverUrl",  "music.coverLarge",                     isHtml=True),
+    SchemaField("musicName",      "music.title",                          isHtml=True),
+    SchemaField("musicArtist",    "music.authorName?",                    default="N/A", isHtml=True),
+    SchemaField("musicAlbum",     "music.album?",                         default="N/A", isHtml=True),
+    SchemaField("musicId",        "music.id?",                            str, default="", isHtml=True),
+
+    # Note: format is only required when the post has a video so a missing format is left as None for the caller to check
+    SchemaField("videoPlayUrl",   "video.playAddr",                       isHtml=True),
+    SchemaField("videoExtension", "video.format?",                        isHtml=True),
+
+    SchemaField("imageUrlLists",  "imagePost?.images[].imageURL.urlList", list[str]),
+]
+
+class PostRecord:
+    """Fields of a post's itemStruct extracted by extractPost. See kPostSchema"""
+
+    __slots__ = tuple(field.name for field in kPostSchema)
+
+    id             : str
+    timestamp      : int
+    comments       : list[str]
+    keywords       : list[str]
+    location       : str
+    description    : str
+
+    userId         : str
+    userNickname   : str
+    userSignature  : str
+
+    musicUrl       : str
+    musicCoverUrl  : str
+    musicName      : str
+    musicArtist    : str
+    musicAlbum     : str
+    musicId        : str
+
+    videoPlayUrl   : str
+    videoExtension : str|None
+
+    # Note: imageUrlLists is None for posts without an imagePost, otherwise it holds the urlList of each image
+    imageUrlLists  : list[list[str]]|None
+
+    def __repr__(self) -> str:
+        return f"PostRecord {{ {', '.join(f'{name}: {getattr(self, name)!r}' for name in self.__slots__)} }}"
+
+
+kMissing = object()
+
+def _parseSchemaValue(value, ParseT:type, path:str):
+    """Slow path of compiled schemas for values that aren't already a `ParseT`"""
+
+    try:
+        return parseValue(value, ParseT, isView=True)
+    except Exception as e:
+        raise ParseException(f"Failed to parse '{path}' as '{ParseT}' | Value = '{value}' | Exception: {e}")
+
+def _getDict(parentDict:dict, key:str, path:str) -> dict:
+    """Returns the dict at `key` of `parentDict`. `path` is the path of `parentDict` and is only used for errors"""
+
+    value = parentDict.get(key, kMissing)
+    if value is kMissing:
+        raise ParseException(f"Missing required key {path}.{key}")
+
+    if type(value) is not dict:
+        raise ParseException(f"Expected dict at {path}.{key} | Value = {value!r}")
+
+    return value
+
+def _compileValueReader(field:SchemaField) -> Callable[[Any, str], Any]:
+    """Returns a reader(value, path) that checks a value against field.ParseT and strips it if field.isHtml"""
+
+    ParseT = field.ParseT
+    ParseTOrigin = get_origin(ParseT)
+    ParseTArgs = get_args(ParseT)
+
+    if ParseT is Any:
+        parse = None
+
+    elif isinstance(ParseT, type):
+        def parse(value, path:str):
+            return value if type(value) is ParseT else _parseSchemaValue(value, ParseT, path)
+
+    # Note: lists of a plain type (Ex: list[str]) are checked by mapping type() over them in C
+    elif ParseTOrigin is list and len(ParseTArgs) == 1 and isinstance(ParseTArgs[0], type):
+        elementTypes = frozenset(ParseTArgs)
+
+        def parse(value, path:str):
+            if type(value) is list and elementTypes.issuperset(map(type, value)):
+                return value
+
+            return _parseSchemaValue(value, ParseT, path)
+
+    else:
+        def parse(value, path:str):
+            return _parseSchemaValue(value, ParseT, path)
+
+    if not field.isHtml:
+        return parse if parse is not None else (lambda value, path: value)
+
+    # Note: inlined parseStripedHtmlString that skips html.unescape for strings without any character references
+    def readHtml(value, path:str):
+        if parse is not None:
+            value = parse(value, path)
+
+        if type(value) is not str:
+            raise ParseException(f"Expected html string at {path} | Value = {value!r}")
+
+        return (html.unescape(value) if "&" in value else value).strip()
+
+    return readHtml
+
+def _compilePathReader(keys:list[str], field:SchemaField) -> Callable[[dict, str], Any]:
+    """ Returns a reader(dict, path) that reads `keys` from a dict and returns the value of the field.
+        `path` is the path of the dict and is only used for errors
+    """
+
+    key, remainingKeys = keys[0], keys[1:]
+
+    isOptional = key.endswith("?")
+    key = key.removesuffix("?")
+
+    isList = key.endswith("[]")
+    key = key.removesuffix("[]")
+
+    if isList:
+        elementReader = _compilePathReader(remainingKeys, field) if remainingKeys else _compileValueReader(field)
+
+        def readValue(value, path:str):
+            if type(value) is not list:
+                raise ParseException(f"Expected list at {path} | Value = {value!r}")
+
+            if not remainingKeys:
+                return [elementReader(element, f"{path}[{i}]") for i, element in enumerate(value)]
+
+            elements = []
+            for i, element in enumerate(value):
+                elementPath = f"{path}[{i}]"
+                if type(element) is not dict:
+                    raise ParseException(f"Expected dict at {elementPath} | Value = {element!r}")
+
+                elements.append(elementReader(element, elementPath))
+
+            return elements
+
+    elif remainingKeys:
+        childReader = _compilePathReader(remainingKeys, field)
+
+        def readValue(value, path:str):
+            if type(value) is not dict:
+                raise ParseException(f"Expected dict at {path} | Value = {value!r}")
+
+            return childReader(value, path)
+
+    else:
+        readValue = _compileValueReader(field)
+
+    if field.defaultFactory is not None:
+        getDefault = field.defaultFactory
+    else:
+        getDefault = lambda default=field.default: default
+
+    def read(parentDict:dict, path:str):
+        value = parentDict.get(key, kMissing)
+        if value is kMissing:
+            if isOptional:
+                return getDefault()
+
+            raise ParseException(f"Missing required key {path}.{key}")
+
+        return readValue(value, f"{path}.{key}")
+
+    return read
+
+
+RecordT = TypeVar("RecordT")
+def compileSchema(schema:list[SchemaField], RecordT:Type[RecordT], rootName:str = "root") -> Callable[[dict], RecordT]:
+    """ Compiles `schema` into a function that reads every field of a json dict into a new `RecordT`.
+        `RecordT` must declare a slot for every field.
+        The readers of each field are built once here. Dicts shared by several fields (Ex: 'music') are looked up once per call.
+        Missing keys and values of the wrong type raise a ParseException with their full path (Ex: 'itemStruct.imagePost.images[2].imageURL')
+    """
+
+    if set(RecordT.__slots__) != {field.name for field in schema}:
+        raise ValueError(f"Slots of '{RecordT.__name__}' don't match schema fields | slots: {RecordT.__slots__}")
+
+    # Note: dictSteps is a list of (parentIndex, key, path) that resolves each shared dict from an earlier one. 
+    #       Index 0 is the root dict and dictIndices maps the keys of each shared dict to its index
+    dictSteps:list[tuple[int, str, str]] = []
+    dictIndices:dict[tuple[str, ...], int] = {(): 0}
+
+    # Note: fieldReaders is a list of (name, dictIndex, path, reader) where reader reads the field from the shared dict at dictIndex
+    fieldReaders:list[tuple[str, int, str, Callable[[dict, str], Any]]] = []
+
+    for field in schema:
+        keys = field.path.split(".")
+
+        # shared dicts are the leading required keys of a path that hold the rest of it
+        dictKeys:tuple[str, ...] = ()
+        path = rootName
+        while len(keys) > 1 and not keys[0].endswith(("?", "[]")):
+            parentIndex = dictIndices[dictKeys]
+            dictKeys+= (keys[0],)
+
+            if dictKeys not in dictIndices:
+                dictIndices[dictKeys] = len(dictSteps) + 1
+                dictSteps.append( (parentIndex, keys[0], path) )
+
+            path = f"{path}.{keys[0]}"
+            keys = keys[1:]
+
+        fieldReaders.append( (field.name, dictIndices[dictKeys], path, _compilePathReader(keys, field)) )
+
+    def extract(root:dict) -> RecordT:
+        if type(root) is not dict:
+            raise ParseException(f"Expected dict at {rootName} | Value = {root!r}")
+
+        dicts = [root]
+        for parentIndex, key, path in dictSteps:
+            dicts.append(_getDict(dicts[parentIndex], key, path))
+
+        record = RecordT.__new__(RecordT)
+        for name, dictIndex, path, reader in fieldReaders:
+            setattr(record, name, reader(dicts[dictIndex], path))
+
+        return record
+
+    return extract
+
+
+gExtractPost = compileSchema(kPostSchema, PostRecord, rootName="itemStruct")
+
+def extractPost(itemStruct:dict|ParsableDictionaryView) -> PostRecord:
+    """Reads the fields of kPostSchema from a post's itemStruct. Raises a ParseException with the failing path on error"""
+
+    if isinstance(itemStruct, ParsableDictionaryView):
+        itemStruct = itemStruct.dict
+
+    return gExtractPost(itemStruct)
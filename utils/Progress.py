@@ -0,0 +1,125 @@
+import threading
+
+from collections import deque
+from datetime import timedelta
+from time import monotonic
+from typing import Callable
+from utils.logging import *
+from utils.parse import parseHumanReadableSize
+
+class Progress:
+    """ Aggregates the byte and post counters pushed by worker threads and periodically reports throughput, ETA and result counts.
+        Reports are printed as a status line every kRenderInterval seconds when stdout is a terminal or logged every kLogInterval seconds otherwise.
+        Use as a context manager so the report thread is stopped and the final report is logged.
+    """
+
+    kRenderInterval = 0.5
+    kLogInterval = 30
+
+    # Note: rates are measured over the last kRateWindow seconds so they follow throttling and proxy changes
+    kRateWindow = 10
+
+    def __init__(self, isTerminal:bool, getStatus:Callable[[], str]|None = None) -> None:
+        """`getStatus` returns extra status appended to each report"""
+
+        self.isTerminal = isTerminal
+        self.getStatus = getStatus
+
+        self.lock = threading.Lock()
+        self.numBytes = 0
+        self.numPosts = 0
+        self.numTotalPosts = 0
+        self.resultCounts:dict[str, int] = {}
+
+        self.startTime = monotonic()
+
+        # Note: samples is in format (time, numBytes, numPosts)
+        self.samples:deque[tuple[float, int, int]] = deque([(self.startTime, 0, 0)])
+
+        self.stopEvent = threading.Event()
+        self.reportThread = threading.Thread(target=self._ReportThread, name="Progress", daemon=True)
+        self.reportThread.start()
+
+    def __enter__(self) -> "Progress":
+        return self
+
+    def __exit__(self, type, value, traceback) -> None:
+        self.Close()
+
+    def Close(self) -> None:
+        if self.stopEvent.is_set():
+            return
+
+        self.stopEvent.set()
+        self.reportThread.join()
+
+        log(f"Finished in {timedelta(seconds=round(monotonic() - self.startTime))} - {self}")
+
+    def AddBytes(self, numBytes:int) -> None:
+        with self.lock:
+            self.numBytes+= numBytes
+
+    def AddPosts(self, numPosts:int = 1) -> None:
+        """Adds `numPosts` to the number of posts expected to finish"""
+
+        with self.lock:
+            self.numTotalPosts+= numPosts
+
+    def AddResult(self, resultName:str) -> None:
+        """Records a finished post with result `resultName`"""
+
+        with self.lock:
+            self.numPosts+= 1
+            self.resultCounts[resultName] = self.resultCounts.get(resultName, 0) + 1
+
+    def GetRates(self) -> tuple[float, float]:
+        """Returns (bytesPerSecond, postsPerSecond) over the last kRateWindow seconds"""
+
+        with self.lock:
+            startTime, startBytes, startPosts = self.samples[0]
+            elapsedTime = monotonic() - startTime
+            if elapsedTime <= 0:
+                return 0, 0
+
+            return (self.numBytes - startBytes) / elapsedTime, (self.numPosts - startPosts) / elapsedTime
+
+    def __str__(self) -> str:
+        bytesPerSecond, postsPerSecond = self.GetRates()
+
+        with self.lock:
+            numRemainingPosts = self.numTotalPosts - self.numPosts
+            eta = timedelta(seconds=round(numRemainingPosts / postsPerSecond)) if postsPerSecond > 0 else "N/A"
+
+            result = f"Posts: {self.numPosts}/{self.numTotalPosts} | {60*postsPerSecond:.1f} posts/min | {parseHumanReadableSize(bytesPerSecond)}/s | Downloaded: {parseHumanReadableSize(self.numBytes)} | ETA: {eta}"
+            if self.resultCounts:
+                result+= f" | Results: {' - '.join(f'{name}: {count}' for name, count in sorted(self.resultCounts.items()))}"
+
+        if self.getStatus is not None:
+            result+= f" | {self.getStatus()}"
+
+        return result
+
+    def _Sample(self) -> None:
+        currentTime = monotonic()
+
+        with self.lock:
+            self.samples.append( (currentTime, self.numBytes, self.numPosts) )
+
+            # Note: the oldest sample is kept once it leaves the window so rates always span at least kRateWindow seconds
+            while len(self.samples) > 2 and self.samples[1][0] <= currentTime - Progress.kRateWindow:
+                self.samples.popleft()
+
+    def _ReportThread(self) -> None:
+        lastLogTime = monotonic()
+
+        while not self.stopEvent.wait(Progress.kRenderInterval):
+            self._Sample()
+
+            if self.isTerminal:
+                print(f"Progress - {self}")
+                continue
+
+            currentTime = monotonic()
+            if currentTime - lastLogTime >= Progress.kLogInterval:
+                lastLogTime = currentTime
+                log(f"Progress - {self}")
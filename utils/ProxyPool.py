@@ -0,0 +1,226 @@
+import requests
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, perf_counter
+from typing import Callable
+from utils.logging import *
+
+class ProxyPool:
+    """ Probes candidate proxies concurrently and hands out the healthy ones ranked by their measured latency.
+        Proxies can be acquired as soon as the first probe succeeds while the remaining probes keep running in the background.
+
+        Each proxy has a circuit breaker that trips after kFailureThreshold consecutive failures and removes the proxy from the pool. 
+        A tripped proxy is probed again (half-open) after kOpenSeconds and rejoins the pool if the probe succeeds.
+    """
+
+    kFailureThreshold = 5
+    kOpenSeconds = 60
+
+    def __init__(self, testUrls:list[str], bannedStrings:list[str], timeout:float, headers:dict[str, str] = {}, numProbeThreads:int = 32, fallbackProxies:Callable[[], list[str]]|None = None) -> None:
+        """ `fallbackProxies` is called once to get more candidates if every probed proxy fails """
+
+        self.testUrls = testUrls
+        self.bannedStrings = [bannedString.lower() for bannedString in bannedStrings]
+        self.timeout = timeout
+        self.headers = headers
+        self.fallbackProxies = fallbackProxies
+
+        self.condition = threading.Condition()
+        self.latencies:dict[str, float] = {}
+        self.numAssigned:dict[str, int] = {}
+        self.numPendingProbes = 0
+
+        # Note: openTimes holds the time each tripped proxy was removed from the pool
+        self.numFailures:dict[str, int] = {}
+        self.openTimes:dict[str, float] = {}
+        self.halfOpenProxies:set[str] = set()
+
+        self.isClosed = False
+        self.probeThreadPool = ThreadPoolExecutor(max_workers=numProbeThreads)
+
+    def Probe(self, proxies:list[str]) -> None:
+        """Starts probing `proxies` in the background"""
+
+        # Note: probes are submitted while holding self.condition so Close can't shut down the thread pool between the check and the submit
+        with self.condition:
+            if self.isClosed:
+                return
+
+            self.numPendingProbes+= len(proxies)
+            for proxy in proxies:
+                self.probeThreadPool.submit(self._ProbeThread, proxy)
+
+    def Close(self) -> None:
+        """ Stops probing proxies. Queued probes are cancelled so the interpreter doesn't wait for them at exit
+            and AcquireProxy returns None from now on
+        """
+
+        with self.condition:
+            self.isClosed = True
+            self.fallbackProxies = None
+            self.probeThreadPool.shutdown(wait=False, cancel_futures=True)
+            self.condition.notify_all()
+
+    def CreateSession(self, proxy:str) -> requests.Session:
+        session = requests.Session()
+        session.proxies.update({
+            "http":  proxy,
+            "https": proxy,
+        })
+
+        session.headers = dict(self.headers)
+        return session
+
+    def AcquireProxy(self) -> str|None:
+        """ Returns the healthy proxy with the lowest latency weighted by the number of threads already using it.
+            Blocks until a probe succeeds and returns None if every probe failed.
+        """
+
+        with self.condition:
+            while True:
+                if self.isClosed:
+                    return None
+
+                nextProbeDelay = self._ProbeOpenProxies()
+                if self.latencies:
+                    break
+
+                if self.numPendingProbes > 0:
+                    self.condition.wait()
+
+                elif nextProbeDelay is not None:
+                    self.condition.wait(timeout=nextProbeDelay)
+
+                else:
+                    return None
+
+            proxy = min(self.latencies, key=lambda proxy: self.latencies[proxy] * (self.numAssigned.get(proxy, 0) + 1))
+            self.numAssigned[proxy] = self.numAssigned.get(proxy, 0) + 1
+
+            return proxy
+
+    def ReleaseProxy(self, proxy:str) -> None:
+        with self.condition:
+            self.numAssigned[proxy]-= 1
+
+    def IsHealthy(self, proxy:str) -> bool:
+        """Returns False if the circuit breaker of `proxy` tripped"""
+
+        with self.condition:
+            return proxy in self.latencies
+
+    def ReportSuccess(self, proxy:str) -> None:
+        with self.condition:
+            self.numFailures[proxy] = 0
+
+    def ReportFailure(self, proxy:str) -> None:
+        """Records a failed request through `proxy` and trips its circuit breaker after kFailureThreshold consecutive failures"""
+
+        with self.condition:
+            numFailures = self.numFailures[proxy] = self.numFailures.get(proxy, 0) + 1
+            if numFailures < ProxyPool.kFailureThreshold or proxy not in self.latencies:
+                return
+
+            self.latencies.pop(proxy)
+            self.numFailures[proxy] = 0
+            self.openTimes[proxy] = monotonic()
+
+        warn(f"Tripped circuit breaker for proxy {proxy} after {numFailures} consecutive failures. Retrying it in {ProxyPool.kOpenSeconds} seconds")
+
+    def GetRankedProxies(self) -> list[tuple[str, float]]:
+        """Returns a list of (proxy, latency) for the healthy proxies sorted by ascending latency"""
+
+        with self.condition:
+            return sorted(self.latencies.items(), key=lambda item: item[1])
+
+    def _ProbeOpenProxies(self) -> float|None:
+        """ Starts half-open probes for tripped proxies whose kOpenSeconds elapsed. 
+            Returns the number of seconds until the next tripped proxy can be probed or None if there are no tripped proxies waiting.
+            Note: must be called while holding self.condition
+        """
+
+        currentTime = monotonic()
+        nextProbeDelay = None
+
+        for proxy, openTime in self.openTimes.items():
+            if proxy in self.halfOpenProxies:
+                continue
+
+            probeDelay = openTime + ProxyPool.kOpenSeconds - currentTime
+            if probeDelay <= 0:
+                log(f"Probing tripped proxy {proxy}", logLevel=LogLevel.Verbose)
+                self.halfOpenProxies.add(proxy)
+                self.Probe([proxy])
+
+            elif nextProbeDelay is None or probeDelay < nextProbeDelay:
+                nextProbeDelay = probeDelay
+
+        return nextProbeDelay
+
+    def _ProbeThread(self, proxy:str) -> None:
+        latency = self._Test(proxy)
+
+        with self.condition:
+            self.numPendingProbes-= 1
+            self.halfOpenProxies.discard(proxy)
+
+            if latency is not None:
+                self.latencies[proxy] = latency
+                self.openTimes.pop(proxy, None)
+
+            elif proxy in self.openTimes:
+                self.openTimes[proxy] = monotonic()
+
+            # Note: fallbackProxies is cleared so it is only loaded once and counts as a pending probe 
+            #       while it loads so AcquireProxy keeps waiting for it
+            fallbackProxies = None
+            if self.numPendingProbes == 0 and not self.latencies and self.fallbackProxies is not None:
+                fallbackProxies, self.fallbackProxies = self.fallbackProxies, None
+                self.numPendingProbes+= 1
+
+            self.condition.notify_all()
+
+        if fallbackProxies is None:
+            return
+
+        log(f"Exhausted proxy list. Trying fallback proxies instead", logLevel=LogLevel.Verbose)
+        try:
+            self.Probe(fallbackProxies())
+
+        except Exception as e:
+            error(f"Failed to load fallback proxies | Exception: {e}")
+
+        finally:
+            with self.condition:
+                self.numPendingProbes-= 1
+                self.condition.notify_all()
+
+    def _Test(self, proxy:str) -> float|None:
+        """Returns the number of seconds it took to fetch testUrls through `proxy` or None if the proxy failed"""
+
+        session = self.CreateSession(proxy)
+        startTime = perf_counter()
+
+        try:
+            for url in self.testUrls:
+                log(f"Testing: {proxy} -> {url}", logLevel=LogLevel.Verbose)
+                response = session.get(url, timeout=self.timeout)
+
+                # test page for ban message
+                responseText = response.text.lower()
+                for bannedString in self.bannedStrings:
+                    if bannedString in responseText:
+                        raise Exception(f"Detected banned string '{bannedString}' in response to: '{url}'")
+
+            latency = perf_counter() - startTime
+            log(f"Got proxy! {proxy} | latency: {latency:.3f}s")
+            return latency
+
+        except Exception as e:
+            log(f"{proxy} -> {url} failed with exception: {e}", logLevel=LogLevel.Verbose)
+
+        finally:
+            session.close()
+
+        return None
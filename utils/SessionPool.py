@@ -0,0 +1,83 @@
+import requests
+import threading
+
+from requests.adapters import HTTPAdapter
+from typing import Callable
+from utils.logging import *
+
+class SessionPool:
+    """ Shares one session per proxy between all worker threads so keep-alive connections to the same host are reused
+        across threads instead of every thread handshaking its own connections.
+        Each session keeps connection pools for up to `numHosts` hosts with up to `hostConnections` idle connections per host.
+    """
+
+    kDefaultNumHosts = 16
+
+    def __init__(self, numHosts:int, hostConnections:int) -> None:
+        self.numHosts = numHosts
+        self.hostConnections = hostConnections
+
+        self.lock = threading.Lock()
+
+        # Note: sessions is in format proxy -> (session, adapter) where proxy is None for direct connections
+        self.sessions:dict[str|None, tuple[requests.Session, HTTPAdapter]] = {}
+
+    def GetSession(self, proxy:str|None, createSession:Callable[[], requests.Session]) -> requests.Session:
+        """Returns the shared session of `proxy`. The first call for a proxy creates its session with `createSession`"""
+
+        with self.lock:
+            sessionEntry = self.sessions.get(proxy)
+            if sessionEntry is not None:
+                return sessionEntry[0]
+
+            # Note: pool_block is left False so a burst beyond hostConnections opens extra connections instead of stalling
+            #       workers. Only hostConnections of them are kept alive afterwards
+            adapter = HTTPAdapter(pool_connections=self.numHosts, pool_maxsize=self.hostConnections)
+
+            session = createSession()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+            self.sessions[proxy] = (session, adapter)
+            log(f"Created shared session for proxy: {proxy} | numHosts: {self.numHosts} | hostConnections: {self.hostConnections}", logLevel=LogLevel.Verbose)
+
+            return session
+
+    def GetConnectionStats(self) -> tuple[int, int]:
+        """ Returns (numNewConnections, numReusedConnections) summed over the connection pools of every session.
+            Note: counts of pools evicted because a session talked to more than numHosts hosts are lost
+        """
+
+        with self.lock:
+            adapters = [adapter for _, adapter in self.sessions.values()]
+
+        numNewConnections = 0
+        numRequests = 0
+        for adapter in adapters:
+
+            # Note: proxied http requests go through the adapter's proxy managers instead of its pool manager
+            poolManagers = [adapter.poolmanager] + list(adapter.proxy_manager.values())
+            for poolManager in poolManagers:
+                for poolKey in poolManager.pools.keys():
+                    pool = poolManager.pools.get(poolKey)
+                    if pool is None:
+                        continue
+
+                    numNewConnections+= pool.num_connections
+                    numRequests+= pool.num_requests
+
+        return numNewConnections, max(0, numRequests - numNewConnections)
+
+    def Close(self) -> None:
+        with self.lock:
+            for session, _ in self.sessions.values():
+                session.close()
+
+            self.sessions.clear()
+
+    def __str__(self) -> str:
+        numNewConnections, numReusedConnections = self.GetConnectionStats()
+        numConnections = numNewConnections + numReusedConnections
+        reuseRate = numReusedConnections / numConnections if numConnections > 0 else 0
+
+        return f"Connections - new: {numNewConnections} | reused: {numReusedConnections} | reuse rate: {100*reuseRate:.2f}%"
@@ -1,126 +1,140 @@
-import os
+import shutil
 import sys
-import io
 import threading
 
 from collections.abc import Iterable
 
 class ThreadedStdOut:
+    """ Stdout replacement that shows the latest line printed by each thread below a header.
+        Writers only store their latest line in a per-thread slot and the screen is redrawn by a background
+        thread at kFrameRate frames per second so writers never block on terminal I/O.
+        Use as a context manager so the render thread is stopped and the final frame is drawn.
+    """
 
-    _globalBuffers: dict[int, io.StringIO] = {}
-    _globalBuffersLock = threading.RLock()
-    _globalMainThreadId:int|None = None
+    kFrameRate = 10
 
-    class BufferReference():
-        def __enter__(self) -> io.StringIO:
-            ThreadedStdOut._globalBuffersLock.acquire()
-            
-            threadId = threading.get_ident()
-            if threadId in ThreadedStdOut._globalBuffers:
-                return ThreadedStdOut._globalBuffers[threadId]
+    # Note: lines longer than kMaxLineLength can't fit on a terminal so only their tail is kept
+    kMaxLineLength = 4096
 
-            buffer = io.StringIO()
-            ThreadedStdOut._globalBuffers[threadId] = buffer
-            return buffer
-        
+    class LineSlot:
+        """Latest line written by a single thread. Only written by its owning thread and only read by the render thread"""
 
-        def __exit__(self, type, value, traceback) -> None:
-            ThreadedStdOut._globalBuffersLock.release()
+        __slots__ = ("partialLine", "line")
 
+        def __init__(self) -> None:
+            self.partialLine = ""
+            self.line = ""
 
-    def write(self, s: str) -> int:
-        with ThreadedStdOut.BufferReference() as buffer:
-            result = buffer.write(s)
-            self._update()
-            return result
-    
-    def writelines(self, lines: Iterable[str]) -> None:
-        with ThreadedStdOut.BufferReference() as buffer:
-            result = buffer.writelines(lines)
-            self._update()
-            return result
+        def Write(self, s:str) -> None:
+            lines = (self.partialLine + s).split("\n")
+            self.partialLine = lines[-1][-ThreadedStdOut.kMaxLineLength:]
+
+            # grab the last non-blank line to print
+            for line in reversed(lines):
+                strippedLine = line.strip()
+                if strippedLine:
+                    self.line = strippedLine[-ThreadedStdOut.kMaxLineLength:]
+                    return
+
+    _globalSlots: dict[int, LineSlot] = {}
+    _globalSlotsLock = threading.Lock()
+    _globalMainThreadId:int|None = None
 
-    def read(self, size: int) -> str:
-        with ThreadedStdOut.BufferReference() as buffer:
-            return buffer.read(size)
+    @staticmethod
+    def _GetSlot() -> LineSlot:
+        threadId = threading.get_ident()
 
-    def readline(self, size: int = -1) -> str:
-        with ThreadedStdOut.BufferReference() as buffer:
-            return buffer.readline(size)
+        # Note: the lock is only taken the first time a thread writes
+        slot = ThreadedStdOut._globalSlots.get(threadId)
+        if slot is None:
+            with ThreadedStdOut._globalSlotsLock:
+                slot = ThreadedStdOut._globalSlots[threadId] = ThreadedStdOut.LineSlot()
 
-    def readlines(self, hint: int = -1) -> list[str]:
-        with ThreadedStdOut.BufferReference() as buffer:
-            return buffer.readlines(hint)
+        return slot
 
-    def seek(self, cookie: int, whence: int = 0) -> int:
-        with ThreadedStdOut.BufferReference() as buffer:
-            return buffer.seek(cookie, whence)
+    def write(self, s: str) -> int:
+        ThreadedStdOut._GetSlot().Write(s)
+        return len(s)
+
+    def writelines(self, lines: Iterable[str]) -> None:
+        slot = ThreadedStdOut._GetSlot()
+        for line in lines:
+            slot.Write(line)
+
+    def flush(self) -> None:
+        pass
 
     def __init__(self, header:str = "", stdout = sys.stdout) -> None:
-        with ThreadedStdOut._globalBuffersLock:
+        with ThreadedStdOut._globalSlotsLock:
 
             # TODO: Add support for nested ThreadedStdOut by making _globalMainThreadId and headers arrays
-            #       And then somehow caching the mainId of the current buffers created in its context so
-            #       we can pop them off _globalBuffers in __del__ 
+            #       And then somehow caching the mainId of the current slots created in its context so
+            #       we can pop them off _globalSlots in Close
             assert ThreadedStdOut._globalMainThreadId is None, f"Nested ThreadedStdOut is not supported"
 
             self.header = header
             self.stdout = stdout
             ThreadedStdOut._globalMainThreadId = threading.get_ident()
 
-            self._update()
-            
+        self.lastFrame:str|None = None
+        self._Render()
 
-    def __del__(self) -> None:
-        with ThreadedStdOut._globalBuffersLock:
-            ThreadedStdOut._globalBuffers = {}
-            ThreadedStdOut._globalMainThreadId = None
+        self.stopEvent = threading.Event()
+        self.renderThread = threading.Thread(target=self._RenderThread, name="ThreadedStdOut", daemon=True)
+        self.renderThread.start()
 
+    def __enter__(self) -> "ThreadedStdOut":
+        return self
 
-    def _update(self) -> None:
-        numTermCols, numTermLines = os.get_terminal_size()
+    def __exit__(self, type, value, traceback) -> None:
+        self.Close()
 
-        # Go home, clear screen, and print header
-        combinedBuffer = f"\x1B[H\x1B[J{self.header}"
+    def Close(self) -> None:
+        """Stops the render thread after drawing the final frame"""
 
-        globalThreadIds = list(ThreadedStdOut._globalBuffers.keys())
-        numThreadIds = len(globalThreadIds)
-        
-        # -2 for header and footer newlines
-        availableLines = numTermLines - 2
+        if self.stopEvent.is_set():
+            return
 
-        for i in range(0, numThreadIds if numThreadIds < availableLines else availableLines):
+        self.stopEvent.set()
+        self.renderThread.join()
 
-            threadId = globalThreadIds[i]
-            buffer = ThreadedStdOut._globalBuffers[threadId]
+        with ThreadedStdOut._globalSlotsLock:
+            ThreadedStdOut._globalSlots = {}
+            ThreadedStdOut._globalMainThreadId = None
 
-            bufferContent = buffer.getvalue()
-            bufferContentLen = len(bufferContent)
+    def _RenderThread(self) -> None:
+        while not self.stopEvent.wait(1 / ThreadedStdOut.kFrameRate):
+            self._Render()
 
-            # grab the last non-blank line to print
-            prevNewLineIndex = bufferContentLen
-            while True:
-                newLineIndex = bufferContent.rfind("\n", 0, prevNewLineIndex)
+        self._Render()
 
-                lineIndex = newLineIndex + 1
-                strippedLine = bufferContent[lineIndex:prevNewLineIndex].strip()
+    def _Render(self) -> None:
+        numTermCols, numTermLines = shutil.get_terminal_size()
 
-                if lineIndex == 0 or len(strippedLine) > 0:
-                    break
+        with ThreadedStdOut._globalSlotsLock:
+            globalSlots = list(ThreadedStdOut._globalSlots.items())
 
-                prevNewLineIndex = newLineIndex
-                
-            # truncate buffer to last line to prevent memory overflow
-            buffer.seek(0)
-            buffer.truncate(0)
-            buffer.write(bufferContent[lineIndex:])
+        numThreadIds = len(globalSlots)
 
+        # -2 for header and footer newlines
+        availableLines = numTermLines - 2
+
+        # Go home, clear screen, and print header
+        frame = f"\x1B[H\x1B[J{self.header}"
+
+        for threadId, slot in globalSlots[:availableLines]:
             prefix = f"\n[{threadId:06}] {'>' if threadId == ThreadedStdOut._globalMainThreadId else '-'} "
-            combinedBuffer+= f"{prefix}{strippedLine}"[:numTermCols]
+            frame+= f"{prefix}{slot.line}"[:numTermCols]
 
         # add footer
-        combinedBuffer+= "\n"
+        frame+= "\n"
         if availableLines < numThreadIds:
-            combinedBuffer+= "..."
-        
-        self.stdout.write(combinedBuffer)
\ No newline at end of file
+            frame+= "..."
+
+        # Note: unchanged frames are skipped so idle runs don't keep redrawing the terminal
+        if frame == self.lastFrame:
+            return
+
+        self.lastFrame = frame
+        self.stdout.write(frame)
+        self.stdout.flush()
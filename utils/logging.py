@@ -1,9 +1,14 @@
 from io import TextIOWrapper
+import atexit
+import json
+import queue
+import sys
 import threading
 import traceback
 from datetime import datetime
+from time import time
 
-from typing import Final
+from typing import Any, Final
 from dataclasses import dataclass, fields
 
 @dataclass
@@ -19,15 +24,26 @@ class LogLevel:
         mapping = {field.name: field.default for field in fields(LogLevel)}
         return dict(sorted(mapping.items(), key=lambda item: item[1]))
 
+# Note: log records are formatted, printed and written to gLogFile by a background writer thread in batches of up to
+#       kLogBatchSize records with one write and flush per batch so logging threads only pay for an enqueue
+kLogBatchSize = 1024
+
 gLogLevel:int = LogLevel.Default
 gLogFile:TextIOWrapper|None = None
 gLogFileLock = threading.RLock()
+gLogJsonLines:bool = False
+gLogQueue = queue.SimpleQueue()
+gLogWriterLock = threading.Lock()
+gLogWriterThread:threading.Thread|None = None
 
-def setLogFile(logFilePath:str) -> TextIOWrapper|None:
+def setLogFile(logFilePath:str, jsonLines:bool = False) -> TextIOWrapper|None:
     """ Sets gLogFile to open a file at `logFilePath` and returns the previously set gLogFile
         If an empty string is provided the log file is disabled.
+        If `jsonLines` is True records are written as JSON Lines with their thread and extra fields (Ex: url, result)
     """
-    global gLogFile
+    global gLogFile, gLogJsonLines
+
+    flushLog()
 
     with gLogFileLock:
 
@@ -35,13 +51,12 @@ def setLogFile(logFilePath:str) -> TextIOWrapper|None:
         if oldLogFile is not None:
             oldLogFile.close()
 
+        gLogFile = None
+        gLogJsonLines = jsonLines
+
         if logFilePath:
             gLogFile = open(logFilePath, "w", errors="replace")
-            gLogFile.reconfigure(
-                write_through=True, # disable buffering 
-                line_buffering=True # flush file at '\n' and thus each log message
-            )
-            
+
         log(f"Changed gLogFile from '{oldLogFile.name if oldLogFile else 'None'}' to '{logFilePath}'", logLevel=LogLevel.Verbose)
 
     return oldLogFile
@@ -59,40 +74,114 @@ def setLogLevel(level:int) -> int:
     return oldLevel
 
 
-def log(msg, prefix:str="MSG", logLevel:int=LogLevel.Default) -> None:
+def flushLog() -> None:
+    """Blocks until every queued log record is printed and written to gLogFile"""
+
+    if gLogWriterThread is None or not gLogWriterThread.is_alive():
+        return
+
+    flushEvent = threading.Event()
+    gLogQueue.put(flushEvent)
+    flushEvent.wait()
+
+
+def log(msg, prefix:str="MSG", logLevel:int=LogLevel.Default, **logFields:Any) -> None:
+    """ Queues `msg` to be printed and written to gLogFile by the log writer thread.
+        `logFields` are extra fields (Ex: url, result) that are only written in JSON Lines log files
+    """
 
     if gLogLevel >= logLevel:
 
-        timeStr = datetime.now().strftime("%H:%M:%S:%f") 
-    
-        msgStart = f"{timeStr} -- {prefix}[{logLevel}]: "
-        msgBody = str(msg).replace("\n", "\n"+" "*len(msgStart))    
-    
-        logStr = msgStart + msgBody + "\n"
-        print(logStr, end="")
+        if gLogWriterThread is None:
+            _startLogWriter()
 
-        # quick check to see if there is a log file
-        if gLogFile is None:
+        gLogQueue.put( (time(), threading.get_ident(), prefix, logLevel, msg, logFields) )
+
+def _startLogWriter() -> None:
+    global gLogWriterThread
+
+    with gLogWriterLock:
+        if gLogWriterThread is not None:
             return
 
-        # write to log file
+        gLogWriterThread = threading.Thread(target=_logWriterThread, name="LogWriter", daemon=True)
+        gLogWriterThread.start()
+        atexit.register(flushLog)
+
+def _formatRecord(logTime:float, prefix:str, logLevel:int, msg) -> str:
+    timeStr = datetime.fromtimestamp(logTime).strftime("%H:%M:%S:%f")
+
+    msgStart = f"{timeStr} -- {prefix}[{logLevel}]: "
+    msgBody = str(msg).replace("\n", "\n"+" "*len(msgStart))
+
+    return msgStart + msgBody + "\n"
+
+def _formatJsonRecord(logTime:float, threadId:int, prefix:str, logLevel:int, msg, logFields:dict[str, Any]) -> str:
+    record = {
+        "time"    : datetime.fromtimestamp(logTime).isoformat(),
+        "thread"  : threadId,
+        "prefix"  : prefix,
+        "level"   : logLevel,
+        "message" : str(msg),
+    }
+    record.update(logFields)
+
+    return json.dumps(record, default=str) + "\n"
+
+def _logWriterThread() -> None:
+    while True:
+
+        # grab a batch of records
+        records = [gLogQueue.get()]
+        while len(records) < kLogBatchSize:
+            try:
+                records.append(gLogQueue.get_nowait())
+            except queue.Empty:
+                break
+
+        flushEvents = []
+        logStrs = []
         with gLogFileLock:
+            for record in records:
+                if isinstance(record, threading.Event):
+                    flushEvents.append(record)
+                    continue
+
+                logTime, threadId, prefix, logLevel, msg, logFields = record
+                logStr = _formatRecord(logTime, prefix, logLevel, msg)
+                logStrs.append(logStr)
+
+                # Note: records queued before the log file was disabled are only printed
+                if gLogFile is not None:
+                    gLogFile.write(_formatJsonRecord(logTime, threadId, prefix, logLevel, msg, logFields) if gLogJsonLines else logStr)
 
-            # Note: we have to recheck gLogFile after we acquire the actual lock because it might have been unset on different thread
             if gLogFile is not None:
-                gLogFile.write(logStr)
+                gLogFile.flush()
+
+        # Note: the batch is printed to the current sys.stdout. Under a ThreadedStdOut log lines show up on the LogWriter line
+        #       instead of the line of the thread that logged them. A failed print must not stop the writer or flushLog would hang
+        if logStrs:
+            try:
+                sys.stdout.write("".join(logStrs))
+                sys.stdout.flush()
+
+            except Exception:
+                pass
+
+        for flushEvent in flushEvents:
+            flushEvent.set()
 
 def panic(msg) -> None:
-    gLogFileLock.acquire()
+    log(msg, "PANIC", logLevel=LogLevel.Error)
+    flushLog()
 
     with gLogFileLock:
-        log(msg, "PANIC", logLevel=LogLevel.Error)
         traceback.print_stack(file=gLogFile)
 
     exit(1)
 
-def warn(msg) -> None:
-    log(msg, prefix="WARN", logLevel=LogLevel.Error)
+def warn(msg, **logFields:Any) -> None:
+    log(msg, prefix="WARN", logLevel=LogLevel.Error, **logFields)
 
-def error(msg) -> None:
-    log(msg, prefix="ERROR", logLevel=LogLevel.Error)    
\ No newline at end of file
+def error(msg, **logFields:Any) -> None:
+    log(msg, prefix="ERROR", logLevel=LogLevel.Error, **logFields)
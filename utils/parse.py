@@ -1,11 +1,13 @@
 import html
-import inspect
 import json
 import os
+import re
+import sys
 import types
 import urllib.parse
 
 from bs4 import BeautifulSoup
+from collections.abc import Mapping
 from copy import copy
 from dataclasses import fields, is_dataclass
 from typing import Any, Optional, Type, TypeVar, Union, Dict, get_args, get_origin
@@ -25,7 +27,14 @@ def parseHumanReadableSize(size:int) -> str:
             return f"{size:.3f} {suffix}"
         size/= 1024 
 
-def parseType(value:str|type) -> type | None:
+# Note: gParsedTypes memoizes resolved string annotations in format (annotation, moduleName) -> type
+#       Unresolved annotations aren't cached because the type may be defined later (Ex: further down the module)
+gParsedTypes:dict[tuple[str, str|None], type] = {}
+
+def parseType(value:str|type, module:types.ModuleType|None = None) -> type | None:
+    """ Returns the type `value` refers to. String annotations are resolved from the builtins, then from `module`
+        and then from the modules of the calling frames.
+    """
 
     valueOrigin = get_origin(value)
     valueType = type( valueOrigin if valueOrigin else value )
@@ -39,46 +48,75 @@ def parseType(value:str|type) -> type | None:
         if value in __builtins__:
             return __builtins__[value]
 
-        splitValue = [name for name in value.split('.')]
-        if len(splitValue) == 0:
-            return None
+        if module is not None:
+            result = _parseModuleType(value, vars(module))
+            if result is not None:
+                return result
 
         # Search backwards through stack frames tying to load the desired type
+        # Note: frames are walked with sys._getframe because inspect.stack() reads the source code of every frame
         # TODO: make this more robust and add support for dynamically loading modules
         #       example: if we call parseType from util.foo with value = 'hello.world'
         #                we should also try to load the util.foo.hello module and instantiate world
         searchedModules = set()
-        stackFrames = inspect.stack()
-        for i in range(1, len(stackFrames)):
+        callerFrame = sys._getframe(1)
+        while callerFrame is not None:
 
-            callerStack = stackFrames[i]
-            callerFrame = callerStack.frame
-            callerModule = inspect.getmodule(callerFrame)
+            moduleGlobals = callerFrame.f_globals
+            moduleName = moduleGlobals.get("__name__")
+            callerFrame = callerFrame.f_back
 
-            if callerModule is None or callerModule in searchedModules:
+            if moduleName in searchedModules:
                 continue
 
-            # Note: this loop always runs at least once
-            result = callerModule
-            for name in splitValue:
-                result = getattr(result, name, None)
-                if result is None:
-                    break
-                
+            result = _parseModuleType(value, moduleGlobals)
             if result is not None:
                 return result
 
-            searchedModules.add(callerModule)
+            searchedModules.add(moduleName)
 
     return None 
 
+def _parseModuleType(typeName:str, moduleGlobals:dict) -> type | None:
+    """Returns the type dotted `typeName` refers to in the module with `moduleGlobals` or None if it isn't defined there"""
+
+    key = (typeName, moduleGlobals.get("__name__"))
+
+    result = gParsedTypes.get(key)
+    if result is not None:
+        return result
+
+    splitName = typeName.split('.')
+    result = moduleGlobals.get(splitName[0])
+    for name in splitName[1:]:
+        if result is None:
+            break
+
+        result = getattr(result, name, None)
+
+    if result is not None:
+        gParsedTypes[key] = result
+
+    return result
+
 
 ParseT = TypeVar("ParseT")
-def parseValue(value, ParseT:Type[ParseT]=Any, raiseException:bool = True) -> ParseT | None:
+def parseValue(value, ParseT:Type[ParseT]=Any, raiseException:bool = True, isView:bool = False) -> ParseT | None:
+    """ Parses `value` as `ParseT`. 
+        If `isView` is True values are returned without being copied and dicts parsed as a ParsableDictionary are wrapped 
+        in a read-only ParsableDictionaryView instead. The result must not be modified because it shares data with `value`
+    """
 
     # Note: we return a copy of the value so modifying parsed data won't modify the original
     if ParseT == Any: 
-        return copy(value)    
+        return value if isView else copy(value)
+
+    if isView and (ParseT is ParsableDictionary or ParseT is ParsableDictionaryView):
+        if isinstance(value, ParsableDictionaryView):
+            return value
+
+        if isinstance(value, dict):
+            return ParsableDictionaryView(value)
 
     # handle parameterized types. Ex: list[int]
     ParseTOrigin = get_origin(ParseT)
@@ -90,7 +128,7 @@ def parseValue(value, ParseT:Type[ParseT]=Any, raiseException:bool = True) -> Pa
         
             for ArgT in ParseTArgs:
 
-                result = parseValue(value, ArgT, raiseException=False)
+                result = parseValue(value, ArgT, raiseException=False, isView=isView)
                 if result is not None:
                     return result
                             
@@ -117,7 +155,12 @@ def parseValue(value, ParseT:Type[ParseT]=Any, raiseException:bool = True) -> Pa
 
                 # parse all our elements to match ArgT
                 ArgT = parseType(ParseTArgs[0])
-                parsedList = [parseValue(v, ArgT, raiseException=raiseException) for v in value]
+
+                # Note: views of lists whose elements are already ArgT are returned as is
+                if isView and type(value) is ParseTOrigin and isinstance(ArgT, type) and all(isinstance(v, ArgT) for v in value):
+                    return value
+
+                parsedList = [parseValue(v, ArgT, raiseException=raiseException, isView=isView) for v in value]
 
             return ParseTOrigin(parsedList)
             
@@ -126,7 +169,7 @@ def parseValue(value, ParseT:Type[ParseT]=Any, raiseException:bool = True) -> Pa
     # Note: Python doesn't support checking isinstance(x, 'origin[args...]') yet, so we strip off args 
     ParseInstanceT = ParseTOrigin if ParseTOrigin else ParseT
     if isinstance(value, ParseInstanceT):
-        return copy(value)
+        return value if isView else copy(value)
 
 
     # try to construct the dataclass from a dict
@@ -136,7 +179,7 @@ def parseValue(value, ParseT:Type[ParseT]=Any, raiseException:bool = True) -> Pa
             parsedArgs = {}
             for field in fields(ParseT):
                 if field.name in value:
-                    parsedArgs[field.name] = parseValue(value[field.name], parseType(field.type), raiseException=True)
+                    parsedArgs[field.name] = parseValue(value[field.name], parseType(field.type, sys.modules.get(ParseT.__module__)), raiseException=True, isView=isView)
 
             return ParseT(**parsedArgs)
         
@@ -188,6 +231,56 @@ class ParsableDictionary(Dict[Type[KeyT], Type[ValueT]]):
         return f"ParsableDictionary {{ {super().__str__()} }}"
     
 
+class ParsableDictionaryView(Mapping):
+    """ Read-only ParsableDictionary over an existing dict that doesn't copy it.
+        Parsed values are returned without copying and nested dicts parsed as a ParsableDictionary are returned as views
+        so a deep tree (Ex: a post's itemStruct) is never duplicated. Parsed values must not be modified.
+    """
+
+    __slots__ = ("dict",)
+
+    def __init__(self, dict:dict) -> None:
+        self.dict = dict
+
+    def __getitem__(self, key):
+        return self.dict[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.dict
+
+    def __iter__(self):
+        return iter(self.dict)
+
+    def __len__(self) -> int:
+        return len(self.dict)
+
+    ParseT = TypeVar("ParseT")
+    def parse(self, key, ParseT:Type[ParseT]=Any) -> ParseT:
+        if key not in self.dict:
+            raise ParseException(f"Missing required '{key}' key in: '{self}'")
+
+        return parseValue(self.dict[key], ParseT, isView=True)
+
+    DefaultT = TypeVar("DefaultT")
+    ParseT   = TypeVar("ParseT")
+    def parseDefault(self, key, defaultValue:DefaultT|None = None, ParseT:Type[ParseT]|None = None) -> DefaultT | ParseT:
+        if key not in self.dict:
+            return defaultValue
+
+        if ParseT is None:
+            # infer ParseT from default type
+            ParseT = Any if defaultValue is None else type(defaultValue)
+
+        return parseValue(self.dict[key], ParseT, isView=True)
+
+    ObjT = TypeVar("ObjT")
+    def instantiate(self, ObjT:Type[ObjT]) -> ObjT:
+        return parseValue(self.dict, ObjT, isView=True)
+
+    def __str__(self) -> str:
+        return f"ParsableDictionaryView {{ {self.dict} }}"
+
+
 def parseGetParams(url:str) -> ParsableDictionary:
     parsedUrl = urllib.parse.urlparse(url)
     params = urllib.parse.parse_qs(parsedUrl.query)    
@@ -254,6 +347,40 @@ def parseHtmlElementsByName(html:str, nameAttribute:str, requiredAttributes:list
     return parseSoupElementsByName(BeautifulSoup(html, 'html.parser'), nameAttribute=nameAttribute, requiredAttributes=requiredAttributes)
 
 
+gScriptOpenTagRegex = re.compile(rb"<script\b[^>]*>", re.IGNORECASE)
+gScriptCloseTagRegex = re.compile(rb"</script\s*>", re.IGNORECASE)
+
+def parseHtmlScriptText(html:bytes|str, scriptId:str) -> str:
+    """ Returns the text of the <script> element with id `scriptId` by scanning the raw html instead of building a soup.
+        Falls back to parseHtmlElement if the script element can't be located unambiguously.
+    """
+
+    htmlBytes = html.encode("utf-8") if isinstance(html, str) else html
+    idBytes = scriptId.encode("utf-8")
+
+    # Note: the id can't be matched by the soup either if it never appears in the html (Ex: captcha pages)
+    idIndex = htmlBytes.find(idBytes)
+    if idIndex == -1:
+        raise ParseException(f"Expected 1 'script' element, got 0 | required attrs: {{'id': '{scriptId}'}}")
+
+    # Note: the id may also be referenced by page javascript so only take the fast path if it appears once
+    if htmlBytes.find(idBytes, idIndex + len(idBytes)) == -1:
+
+        tagStartIndex = htmlBytes.rfind(b"<", 0, idIndex)
+        openTagMatch = gScriptOpenTagRegex.match(htmlBytes, tagStartIndex)
+
+        if openTagMatch is not None and openTagMatch.end() > idIndex:
+            closeTagMatch = gScriptCloseTagRegex.search(htmlBytes, openTagMatch.end())
+
+            if closeTagMatch is not None:
+                try:
+                    return htmlBytes[openTagMatch.end():closeTagMatch.start()].decode("utf-8")
+                except UnicodeDecodeError:
+                    pass
+
+    return parseHtmlElement(html, "script", {"id": scriptId}).text
+
+
 def parseStripedHtmlString(htmlStr:str, emptyValue:str = "") -> str:
     result = html.unescape(htmlStr).strip()
     return result if result else emptyValue